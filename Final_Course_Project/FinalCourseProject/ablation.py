@@ -0,0 +1,208 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from catboost import CatBoostClassifier, Pool
+from sklearn.metrics import accuracy_score, cohen_kappa_score
+from sklearn.model_selection import train_test_split
+
+from preprocess import DataPreprocessor
+from train_model import load_labeled_data
+from config import (TRAIN_DATA_PATH, TRAIN_TEST_SPLIT,
+                    CATBOOST_BORDER_COUNT, CATBOOST_FEATURE_BORDER_TYPE,
+                    ABLATION_ITERATIONS, ABLATION_EARLY_STOPPING, ABLATION_SEEDS,
+                    ABLATION_WORKERS, ABLATION_RESULTS_PATH)
+
+# Instrumentos (prefijo antes de '-') en el orden en que se guardan las
+# columnas. Los subconjuntos formados por instrumentos contiguos son
+# rebanadas de la matriz y no necesitan copia. 'FE' son las variables
+# derivadas de features.py.
+INSTRUMENT_ORDER = ['Basic_Demos', 'CGAS', 'Physical', 'Fitness_Endurance', 'FGC', 'BIA',
+                    'PAQ_A', 'PAQ_C', 'SDS', 'PreInt_EduHx', 'FE', 'PCIAT']
+
+FEATURE_SUBSETS = {
+    'demographics': ['Basic_Demos'],
+    'physical': ['Physical', 'Fitness_Endurance', 'FGC', 'BIA'],
+    'activity': ['PAQ_A', 'PAQ_C'],
+    'sleep': ['SDS'],
+    'internet': ['PreInt_EduHx'],
+    'engineered': ['FE'],
+    'tabular': [name for name in INSTRUMENT_ORDER if name != 'PCIAT'],
+    'tabular_pciat': INSTRUMENT_ORDER,
+}
+
+
+def instrument(column):
+    return column.split('-', 1)[0]
+
+
+class FeatureMatrix:
+    """
+    Todas las columnas preprocesadas una sola vez (DataPreprocessor) en una
+    matriz float32 ordenada por columnas (Fortran) y agrupada por
+    instrumento. Cada subconjunto es una vista de esa matriz, así que los
+    experimentos no vuelven a preprocesar ni a convertir categóricas.
+    """
+
+    def __init__(self, X, y):
+        rank = {name: i for i, name in enumerate(INSTRUMENT_ORDER)}
+        columns = list(X.columns)
+        # Instrumentos desconocidos van antes de PCIAT para no romper 'tabular'
+        order = sorted(range(len(columns)),
+                       key=lambda j: (rank.get(instrument(columns[j]), len(INSTRUMENT_ORDER) - 1.5), j))
+
+        self.columns = [columns[j] for j in order]
+        self.position = {col: i for i, col in enumerate(self.columns)}
+        self.values = np.asfortranarray(X.to_numpy(dtype=np.float32, na_value=np.nan)[:, order])
+        self.labels = np.asarray(y, dtype=np.int64)
+
+    @classmethod
+    def from_raw(cls, X_raw, y, fit_rows):
+        """
+        Preprocesa todas las filas con un DataPreprocessor ajustado solo en
+        `fit_rows`, para que medianas y códigos no vean las filas de evaluación.
+        """
+        preprocessor = DataPreprocessor()
+        preprocessor.fit(X_raw.iloc[fit_rows])
+        return cls(preprocessor.transform(X_raw), y)
+
+    def subset_columns(self, instruments):
+        wanted = set(instruments)
+        return [col for col in self.columns if instrument(col) in wanted]
+
+    def view(self, columns, rows=None):
+        """
+        Columnas pedidas como matriz. Si ocupan posiciones contiguas se
+        devuelve una vista sin copia; si no, una copia con np.take.
+        `rows` restringe además las filas (con copia).
+        """
+        idx = np.array([self.position[col] for col in columns])
+        if len(idx) and np.array_equal(idx, np.arange(idx[0], idx[0] + len(idx))):
+            values = self.values[:, idx[0]:idx[0] + len(idx)]
+        else:
+            values = np.take(self.values, idx, axis=1)
+        return values if rows is None else values[rows]
+
+
+def split_rows(labels, seed, test_size=TRAIN_TEST_SPLIT):
+    """
+    Partición estratificada en entrenamiento / parada temprana / evaluación.
+    La evaluación (`test_size` del total) solo se usa para el QWK reportado;
+    la parada temprana sale de `test_size` de las filas restantes.
+    """
+    indices = np.arange(len(labels))
+    dev_idx, holdout_idx = train_test_split(indices, test_size=test_size,
+                                            stratify=labels, random_state=seed)
+    train_idx, early_stop_idx = train_test_split(dev_idx, test_size=test_size,
+                                                 stratify=labels[dev_idx], random_state=seed)
+    return train_idx, early_stop_idx, holdout_idx
+
+
+def _quantized_pool(matrix, columns, rows):
+    """Pool cuantizado con bordes calculados solo sobre las filas de entrenamiento."""
+    pool = Pool(matrix.view(columns, rows), matrix.labels[rows], feature_names=columns)
+    pool.quantize(border_count=CATBOOST_BORDER_COUNT, feature_border_type=CATBOOST_FEATURE_BORDER_TYPE)
+    return pool
+
+
+def _run_experiment(name, columns, matrix, split, seed, iterations, early_stopping, thread_count):
+    train_idx, early_stop_idx, holdout_idx = split
+    train_pool = _quantized_pool(matrix, columns, train_idx)
+    # El modelo cuantiza la parada temprana y la evaluación con los bordes del entrenamiento
+    early_stop_pool = Pool(matrix.view(columns, early_stop_idx), matrix.labels[early_stop_idx],
+                           feature_names=columns)
+
+    model = CatBoostClassifier(
+        iterations=iterations,
+        early_stopping_rounds=early_stopping,
+        random_state=seed,
+        thread_count=thread_count,
+        verbose=False,
+        allow_writing_files=False
+    )
+    start = time.time()
+    model.fit(train_pool, eval_set=early_stop_pool)
+    elapsed = time.time() - start
+
+    y_holdout = matrix.labels[holdout_idx]
+    y_pred = np.asarray(model.predict(matrix.view(columns, holdout_idx))).reshape(-1).astype(int)
+    return {
+        'subset': name,
+        'seed': seed,
+        'n_features': len(columns),
+        'qwk': float(cohen_kappa_score(y_holdout, y_pred, weights='quadratic')),
+        'accuracy': float(accuracy_score(y_holdout, y_pred)),
+        'best_iteration': int(model.get_best_iteration() or 0),
+        'fit_seconds': elapsed,
+    }
+
+
+def run_ablation(X_raw, y, subsets=None, seeds=ABLATION_SEEDS, workers=ABLATION_WORKERS,
+                 iterations=ABLATION_ITERATIONS, early_stopping=ABLATION_EARLY_STOPPING):
+    """
+    Entrena cada subconjunto x semilla en paralelo (hilos: CatBoost libera
+    el GIL y todos comparten la misma matriz). Cada semilla fija una
+    partición entrenamiento / parada temprana / evaluación y un
+    preprocesado ajustado solo en su entrenamiento; el QWK se mide en la
+    evaluación. Devuelve un DataFrame con una fila por experimento.
+    """
+    subsets = subsets or FEATURE_SUBSETS
+    seeds = list(range(seeds)) if isinstance(seeds, int) else list(seeds)
+    thread_count = max(1, (os.cpu_count() or 1) // workers)
+    labels = np.asarray(y, dtype=np.int64)
+
+    jobs = []
+    for seed in seeds:
+        split = split_rows(labels, seed)
+        matrix = FeatureMatrix.from_raw(X_raw, labels, split[0])
+        for name, instruments in subsets.items():
+            columns = matrix.subset_columns(instruments)
+            if not columns:
+                if seed == seeds[0]:
+                    print(f"⚠️  Subconjunto '{name}' sin columnas, se omite")
+                continue
+            jobs.append((name, columns, matrix, split, seed, iterations, early_stopping, thread_count))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda job: _run_experiment(*job), jobs))
+    return pd.DataFrame(results)
+
+
+def compare(results):
+    """Tabla comparativa por subconjunto, de mayor a menor QWK medio."""
+    table = results.groupby('subset').agg(
+        n_features=('n_features', 'first'),
+        qwk_mean=('qwk', 'mean'),
+        qwk_std=('qwk', 'std'),
+        accuracy_mean=('accuracy', 'mean'),
+        best_iteration_mean=('best_iteration', 'mean'),
+        fit_seconds=('fit_seconds', 'sum'),
+    )
+    return table.sort_values('qwk_mean', ascending=False).reset_index()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ablación de subconjuntos de variables (CatBoost + QWK)")
+    parser.add_argument("--data", default=TRAIN_DATA_PATH)
+    parser.add_argument("--subsets", nargs="+", choices=list(FEATURE_SUBSETS), default=None)
+    parser.add_argument("--seeds", type=int, default=ABLATION_SEEDS)
+    parser.add_argument("--workers", type=int, default=ABLATION_WORKERS)
+    parser.add_argument("--output", default=ABLATION_RESULTS_PATH)
+    args = parser.parse_args()
+
+    X_raw, y = load_labeled_data(args.data)
+    subsets = {name: FEATURE_SUBSETS[name] for name in args.subsets} if args.subsets else None
+
+    start = time.time()
+    results = run_ablation(X_raw, y, subsets, seeds=args.seeds, workers=args.workers)
+    table = compare(results)
+
+    print(table.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    print(f"\n⏱️  {len(results)} experimentos en {time.time() - start:.1f} s")
+
+    table.to_csv(args.output, index=False)
+    print(f"✅ Tabla guardada en {args.output}")
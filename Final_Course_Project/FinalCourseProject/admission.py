@@ -0,0 +1,200 @@
+import math
+import threading
+import time
+from collections import deque
+
+from config import (ADMISSION_MAX_INFLIGHT_ROWS, ADMISSION_MAX_INFLIGHT_BYTES,
+                    ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT,
+                    ADMISSION_SMALL_JOB_BYTES, ADMISSION_SMALL_RESERVE,
+                    CSV_BYTES_PER_ROW, BINARY_BYTES_PER_ROW)
+
+
+class Overloaded(Exception):
+    """
+    El servidor no puede admitir la petición ahora; el cliente debe
+    reintentar pasados `retry_after` segundos.
+    """
+
+    def __init__(self, message, status_code=503, retry_after=1):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def estimate_rows(size_bytes, filename=''):
+    """
+    Estima filas a partir del tamaño antes de leer el archivo. Los formatos
+    binarios ocupan menos por fila, así que la estimación es más alta.
+    """
+    per_row = CSV_BYTES_PER_ROW if filename.lower().endswith('.csv') else BINARY_BYTES_PER_ROW
+    return max(1, int(math.ceil(size_bytes / per_row)))
+
+
+class Ticket:
+    def __init__(self, rows, size_bytes, small):
+        self.rows = rows
+        self.bytes = size_bytes
+        self.small = small
+        self.granted = threading.Event()
+        self.enqueued_at = time.time()
+        self.started_at = None
+
+
+class AdmissionController:
+    """
+    Limita filas y bytes en vuelo con una cola acotada.
+
+    Los trabajos pequeños y grandes esperan en colas separadas. Una fracción
+    de la capacidad (ADMISSION_SMALL_RESERVE) queda reservada para los
+    pequeños, de modo que un archivo enorme no bloquea las peticiones
+    interactivas. Mientras haya trabajos grandes esperando, los pequeños
+    solo usan esa reserva, así que los grandes tampoco se quedan sin turno.
+    """
+
+    def __init__(self,
+                 max_rows=ADMISSION_MAX_INFLIGHT_ROWS,
+                 max_bytes=ADMISSION_MAX_INFLIGHT_BYTES,
+                 max_queue=ADMISSION_MAX_QUEUE,
+                 queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+                 small_job_bytes=ADMISSION_SMALL_JOB_BYTES,
+                 small_reserve=ADMISSION_SMALL_RESERVE):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.small_job_bytes = small_job_bytes
+        self.small_reserve = small_reserve
+
+        self.lock = threading.Lock()
+        self.small_queue = deque()
+        self.large_queue = deque()
+        self.inflight = {'rows': 0, 'bytes': 0, 'jobs': 0}
+        self.inflight_large = {'rows': 0, 'bytes': 0}
+        self.inflight_small = {'rows': 0, 'bytes': 0}
+        # Media móvil del tiempo de servicio, para el Retry-After
+        self.avg_service_time = 1.0
+        self.rejected = 0
+
+    def acquire(self, size_bytes, filename=''):
+        """
+        Reserva capacidad para una subida de `size_bytes`. Bloquea en cola
+        hasta queue_timeout; lanza Overloaded si no hay sitio.
+        """
+        rows = estimate_rows(size_bytes, filename)
+        small = size_bytes <= self.small_job_bytes
+        ticket = Ticket(rows, size_bytes, small)
+
+        with self.lock:
+            large_limit = 1.0 - self.small_reserve
+            if not small and (rows > self.max_rows * large_limit or size_bytes > self.max_bytes * large_limit):
+                self.rejected += 1
+                raise Overloaded('Archivo demasiado grande para procesarse', status_code=413, retry_after=0)
+
+            if len(self.small_queue) + len(self.large_queue) >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded('Demasiadas peticiones en cola', status_code=429,
+                                 retry_after=self._retry_after())
+
+            (self.small_queue if small else self.large_queue).append(ticket)
+            self._dispatch()
+
+        if not ticket.granted.wait(self.queue_timeout):
+            with self.lock:
+                if not ticket.granted.is_set():
+                    (self.small_queue if small else self.large_queue).remove(ticket)
+                    self.rejected += 1
+                    raise Overloaded('Servidor ocupado, tiempo de espera agotado',
+                                     status_code=503, retry_after=self._retry_after())
+
+        ticket.started_at = time.time()
+        return ticket
+
+    def release(self, ticket):
+        with self.lock:
+            self._account(ticket, -1)
+            if ticket.started_at is not None:
+                elapsed = time.time() - ticket.started_at
+                self.avg_service_time = 0.8 * self.avg_service_time + 0.2 * elapsed
+            self._dispatch()
+
+    def adjust_rows(self, ticket, actual_rows):
+        """
+        Sustituye la estimación por el número real de filas una vez leído el archivo.
+        """
+        with self.lock:
+            delta = actual_rows - ticket.rows
+            ticket.rows = actual_rows
+            self.inflight['rows'] += delta
+            (self.inflight_small if ticket.small else self.inflight_large)['rows'] += delta
+            if delta < 0:
+                self._dispatch()
+
+    def admit(self, size_bytes, filename=''):
+        return _Admission(self, size_bytes, filename)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'inflight_rows': self.inflight['rows'],
+                'inflight_bytes': self.inflight['bytes'],
+                'inflight_jobs': self.inflight['jobs'],
+                'queued_small': len(self.small_queue),
+                'queued_large': len(self.large_queue),
+                'rejected': self.rejected,
+                'avg_service_time': round(self.avg_service_time, 3),
+            }
+
+    def _fits(self, ticket):
+        rows = self.inflight['rows'] + ticket.rows
+        size = self.inflight['bytes'] + ticket.bytes
+        if rows > self.max_rows or size > self.max_bytes:
+            # Un trabajo solo puede superar el límite si no hay nada más en vuelo
+            return self.inflight['jobs'] == 0
+
+        if ticket.small:
+            if not self.large_queue:
+                return True
+            reserve_rows = self.max_rows * self.small_reserve
+            reserve_bytes = self.max_bytes * self.small_reserve
+            return (self.inflight_small['rows'] + ticket.rows <= reserve_rows
+                    and self.inflight_small['bytes'] + ticket.bytes <= reserve_bytes)
+
+        large_limit = 1.0 - self.small_reserve
+        return (self.inflight_large['rows'] + ticket.rows <= self.max_rows * large_limit
+                and self.inflight_large['bytes'] + ticket.bytes <= self.max_bytes * large_limit)
+
+    def _dispatch(self):
+        # Primero los pequeños (latencia interactiva), después los grandes en orden FIFO
+        for queue in (self.small_queue, self.large_queue):
+            while queue and self._fits(queue[0]):
+                ticket = queue.popleft()
+                self._account(ticket, +1)
+                ticket.granted.set()
+
+    def _account(self, ticket, sign):
+        self.inflight['rows'] += sign * ticket.rows
+        self.inflight['bytes'] += sign * ticket.bytes
+        self.inflight['jobs'] += sign
+        share = self.inflight_small if ticket.small else self.inflight_large
+        share['rows'] += sign * ticket.rows
+        share['bytes'] += sign * ticket.bytes
+
+    def _retry_after(self):
+        waiting = len(self.small_queue) + len(self.large_queue) + 1
+        running = max(1, self.inflight['jobs'])
+        return max(1, int(math.ceil(self.avg_service_time * waiting / running)))
+
+
+class _Admission:
+    def __init__(self, controller, size_bytes, filename):
+        self.controller = controller
+        self.size_bytes = size_bytes
+        self.filename = filename
+        self.ticket = None
+
+    def __enter__(self):
+        self.ticket = self.controller.acquire(self.size_bytes, self.filename)
+        return self.ticket
+
+    def __exit__(self, exc_type, exc, tb):
+        self.controller.release(self.ticket)
@@ -1,35 +1,79 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, send_file, stream_with_context
 from flask_cors import CORS
-import pandas as pd
+import gzip
 import os
-import io
 from train_model import train_model_if_needed, ModelTrainer
 from preprocess import DataPreprocessor
-from config import MODEL_PATH, TRAIN_DATA_PATH, PORT
+from ingest import read_upload, projected_columns, is_supported
+from drift import DriftMonitor
+from admission import AdmissionController, Overloaded
+from results_store import ResultStore, ResultNotFound
+from storage import Storage
+from config import (MODEL_PATH, TRAIN_DATA_PATH, PORT, RETRAIN_POLICY, MAX_UPLOAD_BYTES, DRIFT_RETRAIN_COOLDOWN,
+                    RESULTS_PAGE_SIZE, RESULTS_MAX_PAGE_SIZE, COMPRESS_MIN_BYTES, STORE_UPLOADS)
+import threading
+import time
 import traceback
+import pandas as pd
+
+try:
+    import zstandard
+except ImportError:  # zstd es opcional; sin él se usa gzip
+    zstandard = None
 
 app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
 CORS(app)
 
 # Variables globales para el modelo
 trainer = None
 current_metrics = None
+drift_monitor = None
+
+# Control de admisión: filas/bytes en vuelo y un solo reentrenamiento a la vez
+admission = AdmissionController()
+retrain_lock = threading.Lock()
+# Último reentrenamiento provocado por deriva (para no repetirlo en cada petición)
+last_drift_retrain = 0.0
+
+# Resultados de predicción persistidos y servidos por páginas
+result_store = ResultStore()
+
+# Base de datos local: participantes, historial de predicciones y linaje de modelos
+storage = Storage()
 
 def initialize_model():
     """
     Inicializa el modelo al arrancar la aplicación
     """
-    global trainer, current_metrics
+    global trainer, current_metrics, drift_monitor
     print("\n" + "="*50)
     print("🚀 Inicializando aplicación...")
     print("="*50)
     
-    trainer = train_model_if_needed(MODEL_PATH, TRAIN_DATA_PATH)
+    try:
+        storage.sync_training_csv(TRAIN_DATA_PATH)
+    except Exception as e:
+        print(f"⚠️  No se pudo sincronizar {TRAIN_DATA_PATH} con la base de datos: {e}")
+
+    ok, result = train_model_if_needed(TRAIN_DATA_PATH, MODEL_PATH, storage=storage)
+    trainer = result if ok else ModelTrainer()
     current_metrics = trainer.metrics
+    drift_monitor = create_drift_monitor()
     
     print("\n✅ Aplicación lista en http://localhost:5000")
     print("="*50 + "\n")
 
+def create_drift_monitor():
+    """
+    Crea el monitor de deriva a partir de la línea base del modelo actual
+    """
+    if trainer is None or trainer.model is None:
+        return None
+    if trainer.drift_baseline is None:
+        trainer.build_drift_baseline(TRAIN_DATA_PATH)
+    return DriftMonitor(trainer.drift_baseline)
+
 # Rutas Frontend
 @app.route('/')
 def index():
@@ -80,47 +124,112 @@ def get_feature_importance():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/drift', methods=['GET'])
+def get_drift():
+    """
+    Retorna el último informe de deriva (?refresh=1 para recalcularlo)
+    """
+    try:
+        if drift_monitor is None:
+            return jsonify({'error': 'Modelo no entrenado'}), 400
+
+        refresh = request.args.get('refresh', '0') in ('1', 'true')
+        return jsonify({
+            'status': 'success',
+            'retrain_policy': RETRAIN_POLICY,
+            'drift': drift_monitor.report(refresh=refresh)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def overloaded_response(error):
+    """
+    Respuesta 413/429/503 con cabecera Retry-After
+    """
+    response = jsonify({'error': str(error), 'retry_after': error.retry_after})
+    response.status_code = error.status_code
+    if error.retry_after:
+        response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
 @app.route('/api/predict', methods=['POST'])
 def predict():
     """
-    Realiza predicción con un archivo CSV/Parquet
+    Realiza predicción con un archivo CSV/Parquet/Arrow
+    """
+    # Sin Content-Length (subida chunked) no se puede estimar el coste
+    size = request.content_length
+    if size is None:
+        return jsonify({'error': 'Se requiere la cabecera Content-Length'}), 411
+    if size > MAX_UPLOAD_BYTES:
+        return jsonify({'error': 'Archivo demasiado grande'}), 413
+
+    # Validar archivo. Werkzeug vuelca a disco las partes grandes del
+    # formulario; el coste real (leer y predecir) se admite después con el
+    # nombre del archivo, que decide los bytes por fila de la estimación
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file provided'}), 400
+
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'Empty filename'}), 400
+
+    if not is_supported(file.filename):
+        return jsonify({'error': 'Formato no soportado. Use CSV, Parquet o Arrow'}), 400
+
+    try:
+        with admission.admit(size, file.filename) as ticket:
+            return run_prediction(ticket, file)
+    except Overloaded as e:
+        return overloaded_response(e)
+
+def run_prediction(ticket, file):
+    """
+    Lee el archivo, reentrena si hace falta y predice (ya admitido)
     """
+    global drift_monitor
     try:
-        # Validar archivo
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file provided'}), 400
-        
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'Empty filename'}), 400
-        
-        # Leer archivo
+        # Leer archivo (solo las columnas que usa el modelo, más el id)
         try:
-            if file.filename.endswith('.csv'):
-                df = pd.read_csv(io.BytesIO(file.read()))
-            elif file.filename.endswith('.parquet'):
-                df = pd.read_parquet(io.BytesIO(file.read()))
-            else:
-                return jsonify({'error': 'Formato no soportado. Use CSV o Parquet'}), 400
+            df = read_upload(file, projected_columns(trainer.preprocessor))
         except Exception as e:
             return jsonify({'error': f'Error leyendo archivo: {str(e)}'}), 400
+
+        admission.adjust_rows(ticket, len(df))
         
-        # REENTRENAMIENTO DEL MODELO
-        print(f"\n🔄 Reentrenando modelo con {len(df)} registros...")
-        success, result = trainer.train(TRAIN_DATA_PATH)
-        
-        if not success:
-            print(f"⚠️  Advertencia: Entrenamiento falló: {result}")
-            # No retornar error, continuar con modelo anterior si existe
-            if trainer.model is None:
-                return jsonify({
-                    'error': f'No se pudo entrenar el modelo: {result}'
-                }), 500
-        else:
-            print(f"✅ Modelo reentrenado exitosamente")
-        
+        # Actualizar estadísticas de deriva con los registros recibidos
+        # (con las columnas derivadas, igual que la línea base)
+        if drift_monitor is not None:
+            drift_monitor.update(trainer.preprocessor.engineer(df))
+
+        # REENTRENAMIENTO DEL MODELO (solo si la política o la deriva lo justifican)
+        needs_retrain = (
+            RETRAIN_POLICY == 'always'
+            or trainer.model is None
+            or drift_retrain_due()
+        )
+        # Si ya hay un reentrenamiento en curso no se lanza otro
+        if needs_retrain and retrain_lock.acquire(blocking=False):
+            try:
+                print(f"\n🔄 Reentrenando modelo con {len(df)} registros...")
+                success, result = trainer.train(TRAIN_DATA_PATH, storage=storage)
+            finally:
+                retrain_lock.release()
+
+            if not success:
+                print(f"⚠️  Advertencia: Entrenamiento falló: {result}")
+                # No retornar error, continuar con modelo anterior si existe
+                if trainer.model is None:
+                    return jsonify({
+                        'error': f'No se pudo entrenar el modelo: {result}'
+                    }), 500
+            else:
+                print(f"✅ Modelo reentrenado exitosamente")
+                drift_monitor = create_drift_monitor()
+
         # Verificar que el modelo existe
-        if trainer.model is None:
+        engine, model_version = trainer.serving_engine()
+        if engine is None:
             return jsonify({
                 'error': 'Modelo no está entrenado. Verifique que data/train.csv es válido y contiene la columna "sii"'
             }), 500
@@ -128,9 +237,7 @@ def predict():
         # Preprocesar datos
         print(f"📊 Preprocesando {len(df)} registros...")
         try:
-            X_processed = trainer.preprocessor.transform(
-                df.drop(columns=['id', 'sii'], errors='ignore')
-            )
+            X_processed = engine.transform(df)
         except Exception as e:
             print(f"❌ Error preprocesando: {str(e)}")
             return jsonify({
@@ -139,29 +246,32 @@ def predict():
         
         # Predicción
         try:
-            predictions, probabilities = trainer.predict(X_processed)
+            predictions, probabilities = engine.predict(X_processed)
         except Exception as e:
             print(f"❌ Error en predicción: {str(e)}")
             return jsonify({
                 'error': f'Error en predicción: {str(e)}'
             }), 500
         
-        # Preparar respuesta
-        results = []
-        for i, (pred, probs) in enumerate(zip(predictions, probabilities)):
-            results.append({
-                'id': df['id'].iloc[i] if 'id' in df.columns else i,
-                'prediction': int(pred),
-                'probability_class_0': float(probs[0]) if len(probs) > 0 else 0.0,
-                'probability_class_1': float(probs[1]) if len(probs) > 1 else float(probs[0]),
-                'confidence': float(max(probs))
-            })
-        
+        # Guardar resultados en el servidor; el cliente pide páginas bajo demanda
+        ids = df['id'].to_numpy() if 'id' in df.columns else range(len(df))
+        result_id, summary = result_store.save(ids, predictions, probabilities)
+        # La persistencia la hace el hilo escritor de Storage, fuera de la petición
+        if 'id' in df.columns:
+            if STORE_UPLOADS:
+                storage.submit(storage.save_unlabeled, df)
+            storage.submit(storage.record_predictions, ids, predictions, probabilities,
+                           model_version=model_version, result_id=result_id)
+        first_page = result_store.page(result_id, page=1, page_size=RESULTS_PAGE_SIZE)
+
         return jsonify({
             'status': 'success',
-            'predictions': results,
+            'result_id': result_id,
+            'summary': summary,
+            'predictions': first_page['rows'],
+            'page_size': RESULTS_PAGE_SIZE,
             'model_metrics': trainer.metrics,
-            'records_processed': len(results)
+            'records_processed': summary['records_processed']
         })
         
     except Exception as e:
@@ -172,6 +282,171 @@ def predict():
             'traceback': traceback.format_exc()
         }), 500
 
+def drift_retrain_due():
+    """
+    Reentrenamiento por deriva: solo si hay datos etiquetados nuevos y como
+    mucho uno cada DRIFT_RETRAIN_COOLDOWN segundos, para no reconstruir el
+    mismo modelo en cada petición mientras la deriva persista
+    """
+    global last_drift_retrain
+    if drift_monitor is None or not drift_monitor.should_retrain():
+        return False
+    if time.time() - last_drift_retrain < DRIFT_RETRAIN_COOLDOWN:
+        return False
+    if not has_new_training_data():
+        return False
+    last_drift_retrain = time.time()
+    return True
+
+def has_new_training_data():
+    """
+    Con deriva solo merece la pena reentrenar si hay filas etiquetadas
+    nuevas o modificadas desde el último modelo
+    """
+    try:
+        storage.sync_training_csv(TRAIN_DATA_PATH)
+        return trainer.has_new_data(storage)
+    except Exception as e:
+        print(f"⚠️  No se pudo consultar la base de datos: {e}")
+        return True
+
+@app.route('/api/participants/<participant_id>', methods=['GET'])
+def get_participant(participant_id):
+    """
+    Retorna un participante conocido (con o sin sii) y su historial de predicciones
+    """
+    try:
+        record = storage.participant(participant_id)
+        if record is None:
+            return jsonify({'error': 'Participante no encontrado'}), 404
+        return jsonify({'status': 'success', 'participant': record})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/participants/<participant_id>/predict', methods=['POST'])
+def predict_participant(participant_id):
+    """
+    Predice para un participante ya guardado, sin volver a subir el archivo
+    """
+    try:
+        if trainer is None or trainer.model is None:
+            return jsonify({'error': 'Modelo no entrenado'}), 400
+
+        record = storage.participant(participant_id)
+        if record is None:
+            return jsonify({'error': 'Participante no encontrado'}), 404
+
+        engine, model_version = trainer.serving_engine()
+        df = pd.DataFrame([record['features']])
+        predictions, probabilities = engine.predict(engine.transform(df))
+        storage.record_predictions([participant_id], predictions, probabilities,
+                                   model_version=model_version)
+
+        return jsonify({
+            'status': 'success',
+            'id': participant_id,
+            'prediction': int(predictions[0]),
+            'probabilities': [float(p) for p in probabilities[0]],
+            'model_version': model_version
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/models', methods=['GET'])
+def get_models():
+    """
+    Retorna el linaje de modelos entrenados (más reciente primero)
+    """
+    try:
+        return jsonify({
+            'status': 'success',
+            'current_version': trainer.model_version if trainer is not None else None,
+            'models': storage.lineage()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/results/<result_id>', methods=['GET'])
+def get_results_page(result_id):
+    """
+    Retorna una página de resultados (?page=&page_size=&sort=&order=asc|desc)
+    """
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        page_size = min(max(int(request.args.get('page_size', RESULTS_PAGE_SIZE)), 1), RESULTS_MAX_PAGE_SIZE)
+        sort = request.args.get('sort') or None
+        order = 'desc' if request.args.get('order') == 'desc' else 'asc'
+
+        data = result_store.page(result_id, page=page, page_size=page_size, sort=sort, order=order)
+        return jsonify({'status': 'success', **data})
+    except ResultNotFound:
+        return jsonify({'error': 'Resultado no encontrado'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/results/<result_id>/summary', methods=['GET'])
+def get_results_summary(result_id):
+    """
+    Retorna el resumen (conteos por clase) calculado en el servidor
+    """
+    try:
+        return jsonify({'status': 'success', 'result_id': result_id,
+                        'summary': result_store.summary(result_id)})
+    except ResultNotFound:
+        return jsonify({'error': 'Resultado no encontrado'}), 404
+
+@app.route('/api/results/<result_id>/download', methods=['GET'])
+def download_results(result_id):
+    """
+    Descarga los resultados completos (?format=csv|parquet)
+    """
+    try:
+        fmt = request.args.get('format', 'csv')
+        if fmt == 'parquet':
+            return send_file(result_store.parquet_path(result_id), mimetype='application/octet-stream',
+                             as_attachment=True, download_name=f'predicciones_{result_id}.parquet')
+        if fmt != 'csv':
+            return jsonify({'error': 'Formato no soportado. Use csv o parquet'}), 400
+
+        result_store.summary(result_id)  # valida que existe antes de empezar el stream
+        return Response(
+            stream_with_context(result_store.csv_stream(result_id)),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename=predicciones_{result_id}.csv'}
+        )
+    except ResultNotFound:
+        return jsonify({'error': 'Resultado no encontrado'}), 404
+
+@app.after_request
+def compress_response(response):
+    """
+    Comprime respuestas JSON grandes con zstd (si está instalado) o gzip
+    """
+    accept = request.headers.get('Accept-Encoding', '')
+    if (response.direct_passthrough or response.status_code != 200
+            or 'Content-Encoding' in response.headers
+            or response.mimetype != 'application/json'):
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+
+    if zstandard is not None and 'zstd' in accept:
+        response.set_data(zstandard.ZstdCompressor(level=3).compress(data))
+        response.headers['Content-Encoding'] = 'zstd'
+    elif 'gzip' in accept:
+        response.set_data(gzip.compress(data, compresslevel=5))
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        return response
+
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
 @app.route('/api/health', methods=['GET'])
 def health():
     """
@@ -179,13 +454,18 @@ def health():
     """
     return jsonify({
         'status': 'healthy',
-        'model_trained': trainer is not None and trainer.model is not None
+        'model_trained': trainer is not None and trainer.model is not None,
+        'admission': admission.stats()
     })
 
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({'error': 'Endpoint no encontrado'}), 404
 
+@app.errorhandler(413)
+def too_large(error):
+    return jsonify({'error': 'Archivo demasiado grande'}), 413
+
 @app.errorhandler(500)
 def server_error(error):
     return jsonify({'error': 'Error interno del servidor'}), 500
@@ -13,11 +13,76 @@ TRAIN_DATA_PATH = os.path.join(DATA_DIR, 'train.csv')
 DEBUG = True
 PORT = 5000
 
+# Configuración de carga de archivos
+# Por encima de este tamaño el archivo subido se vuelca a disco y se mapea en memoria
+UPLOAD_SPOOL_THRESHOLD = 8 * 1024 * 1024  # bytes
+MAX_UPLOAD_BYTES = 200 * 1024 * 1024      # Peticiones mayores se rechazan con 413
+
+# Control de admisión de /api/predict
+ADMISSION_MAX_INFLIGHT_ROWS = 2_000_000   # Filas (estimadas) procesándose a la vez
+ADMISSION_MAX_INFLIGHT_BYTES = 512 * 1024 * 1024
+ADMISSION_MAX_QUEUE = 16                  # Peticiones en espera antes de responder 429
+ADMISSION_QUEUE_TIMEOUT = 30              # Segundos en cola antes de responder 503
+ADMISSION_SMALL_JOB_BYTES = 1024 * 1024   # Hasta este tamaño una petición es "pequeña"
+ADMISSION_SMALL_RESERVE = 0.25            # Fracción de capacidad reservada a las pequeñas
+CSV_BYTES_PER_ROW = 200                   # Para estimar filas a partir del tamaño
+BINARY_BYTES_PER_ROW = 100                # Parquet / Arrow
+
 # Configuración CatBoost
 CATBOOST_ITERATIONS = 100
 CATBOOST_VERBOSE = False
 TRAIN_TEST_SPLIT = 0.2
 
+# 'classifier' (multiclase) u 'ordinal' (regresión + cortes que maximizan el QWK)
+MODEL_MODE = os.getenv('MODEL_MODE', 'classifier')
+ORDINAL_CV_FOLDS = 5            # Pliegues para las predicciones fuera de muestra que ajustan los cortes
+
+# Cuantización: los pools cuantizados se guardan por hash de datos + bordes
+CATBOOST_BORDER_COUNT = 254
+CATBOOST_FEATURE_BORDER_TYPE = 'GreedyLogSum'
+POOL_CACHE_DIR = os.path.join(DATA_DIR, 'pool_cache')
+POOL_CACHE_SIZE = 4
+
+# Inferencia: 'catboost' (Python) o 'compiled' (exportación C++ compilada con g++)
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'catboost')
+COMPILED_MODEL_DIR = os.path.join(DATA_DIR, 'compiled')
+COMPILED_MODEL_CACHE_SIZE = 2   # Librerías compiladas que se conservan en disco
+
+# Base de datos local (SQLite en modo WAL): participantes, predicciones y linaje de modelos
+DATABASE_PATH = os.path.join(DATA_DIR, 'kaggle.db')
+STORAGE_BATCH_SIZE = 5000       # Filas por executemany
+STORAGE_WRITE_QUEUE = 4         # Escrituras de /api/predict pendientes antes de frenar las peticiones
+STORE_UPLOADS = os.getenv('STORE_UPLOADS', 'true').lower() == 'true'  # Guardar los registros subidos
+
+# Almacén de resultados de predicción
+RESULTS_DIR = os.path.join(DATA_DIR, 'results')
+RESULTS_MAX_STORED = 50         # Ejecuciones que se conservan en disco
+RESULTS_CACHE_SIZE = 8          # Ejecuciones mantenidas en memoria
+RESULTS_PAGE_SIZE = 100
+RESULTS_MAX_PAGE_SIZE = 1000
+COMPRESS_MIN_BYTES = 1024       # Respuestas JSON menores no se comprimen
+
+# Monitor de deriva de datos (drift)
+# 'drift': reentrenar solo si se detecta deriva; 'always': reentrenar en cada predicción
+RETRAIN_POLICY = os.getenv('RETRAIN_POLICY', 'drift')
+DRIFT_BINS = 10                 # Bins por columna numérica (cuantiles del entrenamiento)
+DRIFT_TOP_K = 16                # Categorías seguidas por columna categórica
+DRIFT_MIN_ROWS = 500            # Filas observadas antes de poder declarar deriva
+DRIFT_CHECK_INTERVAL = 60       # Segundos entre recálculos del informe
+DRIFT_CHECK_ROWS = 5000         # ... o filas nuevas entre recálculos
+DRIFT_PSI_THRESHOLD = 0.2
+DRIFT_KS_THRESHOLD = 0.15
+DRIFT_MISSING_THRESHOLD = 0.1   # Diferencia absoluta en la tasa de faltantes
+DRIFT_MEDIAN_THRESHOLD = 0.1    # Cambio en la fracción de valores <= mediana imputada
+DRIFT_RETRAIN_COOLDOWN = 3600   # Segundos mínimos entre reentrenamientos provocados por deriva
+
+# Ablación de subconjuntos de variables (ablation.py)
+ABLATION_ITERATIONS = 500
+ABLATION_EARLY_STOPPING = 50    # Rondas sin mejora en validación antes de parar
+ABLATION_SEEDS = 3              # Semillas (partición + modelo) por subconjunto
+ABLATION_WORKERS = 4            # Experimentos entrenando a la vez
+ABLATION_RESULTS_PATH = os.path.join(DATA_DIR, 'ablation_results.csv')
+
 # Columnas a usar
 TARGET_COLUMN = 'sii'
 ID_COLUMN = 'id'
@@ -0,0 +1,275 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from features import MISSING_CODE
+from config import (DRIFT_BINS, DRIFT_TOP_K, DRIFT_MIN_ROWS, DRIFT_CHECK_INTERVAL,
+                    DRIFT_CHECK_ROWS, DRIFT_PSI_THRESHOLD, DRIFT_KS_THRESHOLD,
+                    DRIFT_MISSING_THRESHOLD, DRIFT_MEDIAN_THRESHOLD)
+
+# Evita log(0) en el PSI cuando un bin queda vacío
+_EPS = 1e-4
+
+
+class NumericSketch:
+    """
+    Histograma de memoria constante sobre bordes fijos (cuantiles del
+    entrenamiento). Se puede fusionar sumando cuentas y basta para PSI, KS
+    aproximado y la fracción de valores por debajo de la mediana imputada.
+    """
+
+    def __init__(self, edges, median):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.median = float(median)
+        self.counts = np.zeros(len(self.edges) + 1, dtype=np.int64)
+        self.below_median = 0
+        self.missing = 0
+        self.total = 0
+
+    @classmethod
+    def from_values(cls, values, bins=DRIFT_BINS):
+        values = np.asarray(values, dtype=np.float64)
+        present = values[~np.isnan(values)]
+        if len(present):
+            quantiles = np.quantile(present, np.linspace(0, 1, bins + 1)[1:-1])
+            median = np.median(present)
+        else:
+            quantiles, median = [], np.nan
+        sketch = cls(np.unique(quantiles), median)
+        sketch.update(values)
+        return sketch
+
+    def empty_like(self):
+        return NumericSketch(self.edges, self.median)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        missing = np.isnan(values)
+        present = values[~missing]
+        self.counts += np.bincount(np.searchsorted(self.edges, present, side='right'),
+                                   minlength=len(self.counts))
+        self.below_median += int((present <= self.median).sum())
+        self.missing += int(missing.sum())
+        self.total += len(values)
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.below_median += other.below_median
+        self.missing += other.missing
+        self.total += other.total
+        return self
+
+    def proportions(self):
+        present = self.counts.sum()
+        if present == 0:
+            return np.zeros(len(self.counts))
+        return self.counts / present
+
+    def missing_rate(self):
+        return self.missing / self.total if self.total else 0.0
+
+    def below_median_rate(self):
+        present = self.total - self.missing
+        return self.below_median / present if present else 0.5
+
+
+class TopKSketch:
+    """
+    Resumen Misra-Gries de las k categorías más frecuentes (memoria O(k),
+    fusionable) para las columnas que el preprocesador trata como
+    categóricas. Las estaciones y el nivel de internet ya llegan como
+    códigos numéricos (features.Codes) y usan NumericSketch.
+    """
+
+    def __init__(self, k=DRIFT_TOP_K):
+        self.k = k
+        self.counters = {}
+        self.missing = 0
+        self.total = 0
+
+    def empty_like(self):
+        return TopKSketch(self.k)
+
+    def update(self, values):
+        series = pd.Series(values)
+        missing = series.isna()
+        self.missing += int(missing.sum())
+        self.total += len(series)
+        counts = series[~missing].astype(str).value_counts()
+        self._add(counts.items())
+
+    def merge(self, other):
+        self.missing += other.missing
+        self.total += other.total
+        self._add(other.counters.items())
+        return self
+
+    def _add(self, items):
+        for value, count in items:
+            self.counters[value] = self.counters.get(value, 0) + int(count)
+        if len(self.counters) > self.k:
+            # Resta la (k+1)-ésima cuenta y descarta lo que quede en cero
+            cut = sorted(self.counters.values(), reverse=True)[self.k]
+            self.counters = {v: c - cut for v, c in self.counters.items() if c > cut}
+
+    def proportions(self, categories):
+        present = self.total - self.missing
+        if present == 0:
+            return np.zeros(len(categories) + 1)
+        known = np.array([self.counters.get(c, 0) for c in categories], dtype=np.float64)
+        other = max(present - known.sum(), 0)
+        return np.append(known, other) / present
+
+    def missing_rate(self):
+        return self.missing / self.total if self.total else 0.0
+
+
+def psi(expected, actual):
+    expected = np.clip(expected, _EPS, None)
+    actual = np.clip(actual, _EPS, None)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def ks(expected, actual):
+    return float(np.max(np.abs(np.cumsum(expected) - np.cumsum(actual)))) if len(expected) else 0.0
+
+
+def _numeric_values(df, col, n_rows, coded):
+    """Columna `col` como float64; en las columnas de códigos MISSING_CODE pasa a NaN."""
+    if col not in df:
+        return np.full(n_rows, np.nan)
+    if col not in coded:
+        return df[col]
+    values = np.asarray(df[col], dtype=np.float64)
+    return np.where(values == MISSING_CODE, np.nan, values)
+
+
+class DriftMonitor:
+    """
+    Acumula sketches de los registros que llegan a /api/predict y los compara
+    periódicamente con la línea base del entrenamiento (PSI, KS, faltantes).
+    """
+
+    def __init__(self, baseline):
+        self.baseline = baseline
+        self.lock = threading.Lock()
+        self.reset()
+
+    @classmethod
+    def from_training_data(cls, df, preprocessor):
+        features = getattr(preprocessor, 'features', None)
+        coded = features.coded_columns if features is not None else []
+        baseline = {'numeric': {}, 'categorical': {}, 'coded': coded, 'rows': len(df)}
+        for col in preprocessor.numeric_columns:
+            values = _numeric_values(df, col, len(df), coded)
+            baseline['numeric'][col] = NumericSketch.from_values(values)
+        for col in preprocessor.categorical_columns:
+            sketch = TopKSketch()
+            sketch.update(df[col] if col in df.columns else [None] * len(df))
+            baseline['categorical'][col] = sketch
+        return cls(baseline)
+
+    def reset(self):
+        with self.lock:
+            self.current = {
+                'numeric': {col: s.empty_like() for col, s in self.baseline['numeric'].items()},
+                'categorical': {col: s.empty_like() for col, s in self.baseline['categorical'].items()},
+            }
+            self.rows = 0
+            self.rows_at_report = 0
+            self.report_time = 0.0
+            self.last_report = None
+
+    def update(self, df):
+        """
+        Incorpora un lote (DataFrame o mapeo de columnas). Si toca según el
+        calendario (tiempo o filas), recalcula el informe.
+        """
+        n_rows = len(df)
+        with self.lock:
+            coded = self.baseline.get('coded', [])
+            for col, sketch in self.current['numeric'].items():
+                sketch.update(_numeric_values(df, col, n_rows, coded))
+            for col, sketch in self.current['categorical'].items():
+                sketch.update(df[col] if col in df else [None] * n_rows)
+            self.rows += n_rows
+
+            due = (time.time() - self.report_time >= DRIFT_CHECK_INTERVAL
+                   or self.rows - self.rows_at_report >= DRIFT_CHECK_ROWS)
+            if due:
+                self._compute_report()
+
+    def report(self, refresh=False):
+        with self.lock:
+            if refresh or self.last_report is None:
+                self._compute_report()
+            return self.last_report
+
+    def should_retrain(self):
+        report = self.report()
+        return report['drift_detected']
+
+    def _compute_report(self):
+        columns = {}
+        drifted = []
+
+        for col, base in self.baseline['numeric'].items():
+            cur = self.current['numeric'][col]
+            expected, actual = base.proportions(), cur.proportions()
+            stats = {
+                'type': 'numeric',
+                'psi': psi(expected, actual),
+                'ks': ks(expected, actual),
+                'missing_rate': cur.missing_rate(),
+                'baseline_missing_rate': base.missing_rate(),
+                'below_median_rate': cur.below_median_rate(),
+                'baseline_below_median_rate': base.below_median_rate(),
+            }
+            # Con variables discretas la fracción base no es 0.5: se compara con ella
+            shift = stats['below_median_rate'] - stats['baseline_below_median_rate']
+            stats['median_stale'] = abs(shift) > DRIFT_MEDIAN_THRESHOLD
+            columns[col] = stats
+
+        for col, base in self.baseline['categorical'].items():
+            cur = self.current['categorical'][col]
+            categories = sorted(base.counters)
+            expected, actual = base.proportions(categories), cur.proportions(categories)
+            columns[col] = {
+                'type': 'categorical',
+                'psi': psi(expected, actual),
+                'ks': None,
+                'missing_rate': cur.missing_rate(),
+                'baseline_missing_rate': base.missing_rate(),
+                'unseen_rate': float(actual[-1]),
+                'top_values': dict(sorted(cur.counters.items(), key=lambda x: -x[1])),
+            }
+
+        enough_rows = self.rows >= DRIFT_MIN_ROWS
+        for col, stats in columns.items():
+            reasons = []
+            if stats['psi'] > DRIFT_PSI_THRESHOLD:
+                reasons.append('psi')
+            if stats['ks'] is not None and stats['ks'] > DRIFT_KS_THRESHOLD:
+                reasons.append('ks')
+            if abs(stats['missing_rate'] - stats['baseline_missing_rate']) > DRIFT_MISSING_THRESHOLD:
+                reasons.append('missing_rate')
+            if stats.get('median_stale'):
+                reasons.append('median')
+            stats['drift'] = enough_rows and bool(reasons)
+            stats['reasons'] = reasons
+            if stats['drift']:
+                drifted.append(col)
+
+        self.last_report = {
+            'rows_observed': self.rows,
+            'baseline_rows': self.baseline['rows'],
+            'min_rows': DRIFT_MIN_ROWS,
+            'computed_at': time.time(),
+            'drift_detected': bool(drifted),
+            'drifted_columns': drifted,
+            'columns': columns,
+        }
+        self.report_time = time.time()
+        self.rows_at_report = self.rows
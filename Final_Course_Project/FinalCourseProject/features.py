@@ -0,0 +1,239 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+# -------------------------------
+# Objetivo: sii a partir del total del PCIAT
+# -------------------------------
+
+PCIAT_TOTAL = 'PCIAT-PCIAT_Total'
+# Definición de la competición (coincide con train.csv): 0-30 ninguno,
+# 31-49 leve, 50-79 moderado, 80+ grave
+SII_EDGES = (30, 49, 79)
+
+INTERNET_HOURS = 'PreInt_EduHx-computerinternet_hoursday'
+INTERNET_LABELS = ('low', 'medium', 'high')
+MISSING = 'missing'
+# Código de Codes para faltantes o valores no reconocidos
+MISSING_CODE = -1.0
+
+SEASONS = ('Spring', 'Summer', 'Fall', 'Winter')
+# Estación en la que se midió cada instrumento
+SEASON_COLUMNS = (
+    'Basic_Demos-Enroll_Season', 'CGAS-Season', 'Physical-Season', 'Fitness_Endurance-Season',
+    'FGC-Season', 'BIA-Season', 'PAQ_A-Season', 'PAQ_C-Season', 'PCIAT-Season', 'SDS-Season',
+    'PreInt_EduHx-Season',
+)
+
+
+def sii_from_pciat(total):
+    """
+    sii (0-3) para cada valor del total del PCIAT, en una sola llamada a
+    np.digitize. Los faltantes quedan como NaN.
+    """
+    values = np.asarray(total, dtype=np.float64)
+    sii = np.digitize(values, SII_EDGES, right=True).astype(np.float64)
+    sii[np.isnan(values)] = np.nan
+    return sii
+
+
+def sii_target(df):
+    """
+    Columna sii del DataFrame: la existente donde hay valor y, donde falta
+    (o si no existe), la derivada de PCIAT-PCIAT_Total. NaN si no hay ninguna.
+    """
+    derived = sii_from_pciat(df[PCIAT_TOTAL]) if PCIAT_TOTAL in df.columns else np.full(len(df), np.nan)
+    if 'sii' not in df.columns:
+        return pd.Series(derived, index=df.index, name='sii')
+    return df['sii'].astype(np.float64).fillna(pd.Series(derived, index=df.index)).rename('sii')
+
+
+def labeled(df):
+    """Filas con sii (existente o derivada), con sii como entero."""
+    out = df.assign(sii=sii_target(df))
+    out = out[out['sii'].notna()].copy()
+    out['sii'] = out['sii'].astype(int)
+    return out
+
+
+def decode(codes, labels, missing=MISSING):
+    """Códigos de un paso Codes -> etiquetas; -1 (o NaN) -> `missing`."""
+    codes = np.nan_to_num(np.asarray(codes, dtype=np.float64), nan=MISSING_CODE).astype(np.int64)
+    lookup = np.array(tuple(labels) + (missing,), dtype=object)
+    return lookup[np.where(codes < 0, len(labels), codes)]
+
+
+# -------------------------------
+# Pasos declarativos
+# -------------------------------
+
+class Bin:
+    """
+    Discretiza `column` en `labels` con bordes fijos o, con
+    edges='quartiles', con los cuartiles 1 y 3 de los datos de ajuste
+    (intervalos cerrados por la derecha, como pd.cut). Los faltantes
+    reciben `missing`.
+    """
+
+    def __init__(self, column, name, labels=INTERNET_LABELS, edges='quartiles', missing=MISSING):
+        self.column = column
+        self.name = name
+        self.labels = tuple(labels)
+        self.edges = edges
+        self.missing = missing
+        self.inputs = (column,)
+        self.fitted_edges = None if edges == 'quartiles' else tuple(edges)
+
+    def fit(self, columns):
+        if self.edges == 'quartiles':
+            values = pd.Series(np.asarray(columns[self.column], dtype=np.float64))
+            self.fitted_edges = tuple(values.quantile([0.25, 0.75]).tolist())
+        return self
+
+    def apply(self, columns, n_rows):
+        lookup = np.array(self.labels + (self.missing,), dtype=object)
+        if self.column not in columns:
+            return lookup[np.full(n_rows, len(self.labels))]
+        values = np.asarray(columns[self.column], dtype=np.float64)
+        codes = np.digitize(values, self.fitted_edges, right=True)
+        codes[np.isnan(values)] = len(self.labels)
+        return lookup[codes]
+
+
+class Codes:
+    """
+    Codifica `column` con el orden de `categories` (0, 1, ...) y MISSING_CODE
+    (-1) para faltantes o valores no reconocidos. Por defecto sustituye la columna.
+    Los códigos son float64, como el resto de columnas numéricas.
+    """
+
+    def __init__(self, column, categories, name=None):
+        self.column = column
+        self.categories = tuple(categories)
+        self.name = name or column
+        self.inputs = (column,)
+
+    def fit(self, columns):
+        return self
+
+    def apply(self, columns, n_rows):
+        if self.column not in columns:
+            return np.full(n_rows, MISSING_CODE)
+        values = columns[self.column]
+        if not isinstance(values, pd.Categorical) and getattr(values, 'cat', None) is None:
+            values = np.asarray(values, dtype=object)
+        return pd.Categorical(values, categories=self.categories).codes.astype(np.float64)
+
+
+class Ratio:
+    """numerator / denominator; NaN si falta alguno o el denominador es 0."""
+
+    def __init__(self, numerator, denominator, name):
+        self.numerator = numerator
+        self.denominator = denominator
+        self.name = name
+        self.inputs = (numerator, denominator)
+
+    def fit(self, columns):
+        return self
+
+    def apply(self, columns, n_rows):
+        if self.numerator not in columns or self.denominator not in columns:
+            return np.full(n_rows, np.nan)
+        num = np.asarray(columns[self.numerator], dtype=np.float64)
+        den = np.asarray(columns[self.denominator], dtype=np.float64)
+        out = np.full(n_rows, np.nan)
+        np.divide(num, den, out=out, where=(den != 0) & ~np.isnan(den))
+        return out
+
+
+class FeaturePipeline:
+    """
+    Lista declarativa de pasos que añaden o recodifican columnas. Los pasos
+    se aplican en orden, así que uno puede usar la salida de otro (p. ej.
+    Codes sobre el Bin del nivel de internet). fit() fija los parámetros que
+    dependen de los datos (p. ej. cuartiles) y descarta los pasos cuyas
+    columnas de entrada no existen; transform() aplica cada paso una vez por
+    columna con operaciones NumPy.
+    """
+
+    def __init__(self, steps):
+        self.steps = list(steps)
+        self.active = []
+
+    @property
+    def input_columns(self):
+        """Columnas en bruto que necesita el pipeline (sin las que genera él mismo)."""
+        produced, inputs = set(), []
+        for step in self.active:
+            inputs += [col for col in step.inputs if col not in produced and col not in inputs]
+            produced.add(step.name)
+        return sorted(inputs)
+
+    @property
+    def output_columns(self):
+        return list(dict.fromkeys(step.name for step in self.active))
+
+    @property
+    def coded_columns(self):
+        """Columnas con códigos de Codes, donde MISSING_CODE equivale a un faltante."""
+        return [step.name for step in self.active if isinstance(step, Codes)]
+
+    def fit(self, columns):
+        self.active = []
+        n_rows = row_count(columns)
+        out = _shallow_copy(columns)
+        for step in self.steps:
+            if all(col in out for col in step.inputs):
+                self.active.append(step.fit(out))
+                out[step.name] = step.apply(out, n_rows)
+        return self
+
+    def transform(self, columns):
+        """
+        Añade las columnas del pipeline. Con un DataFrame devuelve una copia
+        superficial (no copia los datos); con un dict, un dict nuevo.
+        """
+        n_rows = row_count(columns)
+        out = _shallow_copy(columns)
+        for step in self.active:
+            out[step.name] = step.apply(out, n_rows)
+        return out
+
+    def fit_transform(self, columns):
+        return self.fit(columns).transform(columns)
+
+
+# Columnas que ve el modelo además de las originales: variables derivadas,
+# nivel de internet y estaciones como códigos ordenados. Lo usan la
+# aplicación (DataPreprocessor / CompiledPreprocessor) y los dos escenarios
+# del Workshop 4. FEATURES_VERSION se incrementa con cada cambio de la lista:
+# los modelos guardados con otra versión se reentrenan al cargarlos.
+FEATURES_VERSION = 2
+
+MODEL_FEATURES = [
+    Ratio('BIA-BIA_Fat', 'BIA-BIA_BMI', 'FE-Fat_BMI_ratio'),
+    Ratio('Physical-Waist_Circumference', 'Physical-Height', 'FE-Waist_Height_ratio'),
+    Ratio(INTERNET_HOURS, 'Basic_Demos-Age', 'FE-Internet_Hours_per_Age'),
+    Bin(INTERNET_HOURS, 'FE-internet_level'),
+    Codes('FE-internet_level', INTERNET_LABELS),
+] + [Codes(col, SEASONS) for col in SEASON_COLUMNS]
+
+
+def model_pipeline():
+    return FeaturePipeline(copy.deepcopy(MODEL_FEATURES))
+
+
+def _shallow_copy(columns):
+    if isinstance(columns, pd.DataFrame):
+        return columns.copy(deep=False)
+    return dict(columns)
+
+
+def row_count(columns):
+    if hasattr(columns, 'shape'):
+        return columns.shape[0]
+    for values in columns.values():
+        return len(values)
+    return 0
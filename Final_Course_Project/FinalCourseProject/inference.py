@@ -0,0 +1,236 @@
+import ctypes
+import hashlib
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from features import MISSING, row_count
+from ordinal import apply_thresholds, ordinal_probabilities
+from training_data import prune_cache_dir
+from config import INFERENCE_BACKEND, COMPILED_MODEL_DIR, COMPILED_MODEL_CACHE_SIZE
+
+# Envoltorio C para aplicar el modelo exportado por CatBoost a un lote de filas
+_BATCH_WRAPPER = """
+
+extern "C" unsigned int catboost_dimension() {
+    return CatboostModelStatic.Dimension;
+}
+
+extern "C" unsigned int catboost_float_feature_count() {
+    return CatboostModelStatic.FloatFeatureCount;
+}
+
+extern "C" void catboost_apply_batch(const float* features, unsigned long rows,
+                                     unsigned long columns, double* out) {
+    std::vector<float> row(columns);
+    const unsigned int dimension = CatboostModelStatic.Dimension;
+    for (unsigned long r = 0; r < rows; ++r) {
+        row.assign(features + r * columns, features + (r + 1) * columns);
+        std::vector<double> values = ApplyCatboostModelMulti(row);
+        for (unsigned int d = 0; d < dimension; ++d) {
+            out[r * dimension + d] = values[d];
+        }
+    }
+}
+"""
+
+
+class CompiledPreprocessor:
+    """
+    Versión exportada de DataPreprocessor: medianas y tablas de códigos en
+    NumPy/dicts, sin sklearn. Aplica el mismo pipeline de variables derivadas
+    y produce directamente la matriz float32 que consume el modelo.
+    """
+
+    def __init__(self, numeric_columns, medians, categorical_columns, category_codes, features=None):
+        self.features = features
+        self.numeric_columns = list(numeric_columns)
+        self.medians = np.asarray(medians, dtype=np.float32)
+        self.categorical_columns = list(categorical_columns)
+        self.category_codes = category_codes
+        self.feature_columns = self.numeric_columns + self.categorical_columns
+
+    @classmethod
+    def from_preprocessor(cls, preprocessor):
+        medians = preprocessor.imputer.statistics_ if preprocessor.numeric_columns else []
+        category_codes = {
+            col: {str(value): code for code, value in enumerate(preprocessor.label_encoders[col].classes_)}
+            for col in preprocessor.categorical_columns
+        }
+        return cls(preprocessor.numeric_columns, medians,
+                   preprocessor.categorical_columns, category_codes,
+                   features=getattr(preprocessor, 'features', None))
+
+    def transform(self, columns):
+        """
+        `columns` es cualquier mapeo nombre -> valores (dict de arrays o DataFrame).
+        Devuelve una matriz float32 contigua con el orden de feature_columns.
+        """
+        if self.features is not None:
+            columns = self.features.transform(columns)
+        n_rows = row_count(columns)
+        X = np.empty((n_rows, len(self.feature_columns)), dtype=np.float32)
+
+        for j, col in enumerate(self.numeric_columns):
+            if col in columns:
+                values = np.asarray(columns[col], dtype=np.float32)
+                X[:, j] = np.where(np.isnan(values), self.medians[j], values)
+            else:
+                X[:, j] = self.medians[j]
+
+        offset = len(self.numeric_columns)
+        for j, col in enumerate(self.categorical_columns):
+            if col in columns:
+                X[:, offset + j] = self._encode(col, columns[col])
+            else:
+                X[:, offset + j] = self._code(col, MISSING)
+
+        return X
+
+    def _code(self, col, value):
+        codes = self.category_codes[col]
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            value = MISSING
+        code = codes.get(str(value))
+        if code is None:
+            code = codes.get(MISSING)
+        if code is None:
+            raise ValueError(f"Valor no visto en entrenamiento para '{col}': {value!r}")
+        return code
+
+    def _encode(self, col, values):
+        cat = getattr(values, 'cat', None)
+        if cat is not None:
+            # Categorical (p. ej. desde Arrow): una búsqueda por categoría
+            lookup = [self._code(col, value) for value in cat.categories]
+            codes = np.asarray(cat.codes)
+            if (codes < 0).any():
+                lookup.append(self._code(col, None))
+            return np.asarray(lookup, dtype=np.float32)[codes]
+
+        # Resto (columnas object de CSV): una búsqueda por valor distinto;
+        # pd.factorize devuelve -1 para None/NaN, que se mapea al código de faltante
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        lookup = [self._code(col, value) for value in uniques]
+        if (codes < 0).any():
+            lookup.append(self._code(col, None))
+        return np.asarray(lookup, dtype=np.float32)[codes]
+
+
+class CompiledModel:
+    """
+    Modelo CatBoost exportado a C++ y compilado como librería compartida.
+    Las librerías se guardan por hash del código generado, así que un
+    reentrenamiento que produce el mismo modelo no vuelve a compilar.
+    """
+
+    def __init__(self, library_path):
+        self.library = ctypes.CDLL(library_path)
+        self.library.catboost_apply_batch.argtypes = [
+            np.ctypeslib.ndpointer(dtype=np.float32, flags='C_CONTIGUOUS'),
+            ctypes.c_ulong, ctypes.c_ulong,
+            np.ctypeslib.ndpointer(dtype=np.float64, flags='C_CONTIGUOUS'),
+        ]
+        self.library.catboost_apply_batch.restype = None
+        self.dimension = self.library.catboost_dimension()
+        self.n_features = self.library.catboost_float_feature_count()
+
+    @classmethod
+    def build(cls, model, cache_dir=COMPILED_MODEL_DIR, compiler=None):
+        compiler = compiler or shutil.which('g++') or shutil.which('c++')
+        if compiler is None:
+            raise RuntimeError('No C++ compiler found')
+
+        with tempfile.TemporaryDirectory() as tmp:
+            source_path = os.path.join(tmp, 'model.cpp')
+            model.save_model(source_path, format='cpp')
+            with open(source_path, 'a') as f:
+                f.write(_BATCH_WRAPPER)
+            with open(source_path, 'rb') as f:
+                digest = hashlib.sha1(f.read()).hexdigest()
+
+            os.makedirs(cache_dir, exist_ok=True)
+            library_path = os.path.join(cache_dir, f'model_{digest}.so')
+            if not os.path.exists(library_path):
+                partial_path = os.path.join(tmp, 'model.so')
+                subprocess.run(
+                    [compiler, '-O2', '-shared', '-fPIC', '-std=c++11', source_path, '-o', partial_path],
+                    check=True, capture_output=True
+                )
+                shutil.move(partial_path, library_path)
+            else:
+                os.utime(library_path)
+            # Una librería ya cargada sigue mapeada aunque se borre
+            prune_cache_dir(cache_dir, COMPILED_MODEL_CACHE_SIZE, prefix='model_', suffix='.so')
+
+        return cls(library_path)
+
+    def raw_predict(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f'Expected {self.n_features} features, got {X.shape[1]}')
+        out = np.empty((X.shape[0], self.dimension), dtype=np.float64)
+        self.library.catboost_apply_batch(X, X.shape[0], X.shape[1], out)
+        return out
+
+
+class InferenceEngine:
+    """
+    Ruta de predicción ligera: preprocesado en NumPy y una única pasada por
+    los árboles (valores crudos), de la que salen etiquetas y probabilidades.
+    Con `ordinal` ({'thresholds', 'scale'}) el modelo es un regresor: la
+    puntuación se corta por los umbrales y las probabilidades salen de un
+    modelo logístico acumulado alrededor de ellos.
+    """
+
+    def __init__(self, model, preprocessor, backend=INFERENCE_BACKEND, ordinal=None):
+        self.model = model
+        self.preprocessor = CompiledPreprocessor.from_preprocessor(preprocessor)
+        self.ordinal = ordinal
+        self.classes = np.asarray(model.classes_) if ordinal is None else None
+        self.backend = 'catboost'
+        self.compiled = None
+
+        if backend == 'compiled':
+            try:
+                self.compiled = CompiledModel.build(model)
+                self.backend = 'compiled'
+            except Exception as e:
+                print(f"⚠️  Compiled model unavailable, using CatBoost: {e}")
+
+    def transform(self, columns):
+        return self.preprocessor.transform(columns)
+
+    def raw_predict(self, X):
+        if self.compiled is not None:
+            return self.compiled.raw_predict(X)
+        return np.asarray(self.model.predict(X, prediction_type='RawFormulaVal'), dtype=np.float64)
+
+    def predict(self, X):
+        """
+        Devuelve (predicciones, probabilidades) a partir de features ya preprocesadas.
+        """
+        raw = self.raw_predict(X)
+
+        if self.ordinal is not None:
+            scores = raw.reshape(-1)
+            thresholds = self.ordinal['thresholds']
+            return apply_thresholds(scores, thresholds), ordinal_probabilities(scores, thresholds, self.ordinal['scale'])
+
+        if raw.ndim == 1 or raw.shape[1] == 1:
+            # Binario (Logloss): el valor crudo es el logit de la clase positiva
+            raw = raw.reshape(-1)
+            positive = 1.0 / (1.0 + np.exp(-raw))
+            probabilities = np.column_stack([1.0 - positive, positive])
+        else:
+            shifted = np.exp(raw - raw.max(axis=1, keepdims=True))
+            probabilities = shifted / shifted.sum(axis=1, keepdims=True)
+
+        predictions = self.classes[probabilities.argmax(axis=1)]
+        return predictions, probabilities
+
@@ -0,0 +1,155 @@
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+from config import ID_COLUMN, UPLOAD_SPOOL_THRESHOLD
+
+CSV_EXTENSIONS = ('.csv',)
+PARQUET_EXTENSIONS = ('.parquet',)
+ARROW_EXTENSIONS = ('.arrow', '.arrows', '.ipc', '.feather')
+SUPPORTED_EXTENSIONS = CSV_EXTENSIONS + PARQUET_EXTENSIONS + ARROW_EXTENSIONS
+
+
+def is_supported(filename):
+    return filename.lower().endswith(SUPPORTED_EXTENSIONS)
+
+
+def projected_columns(preprocessor):
+    """
+    Columnas que realmente necesita el modelo (más las entradas de las
+    variables derivadas y el id), o None para leer todas.
+    """
+    if preprocessor is None or not preprocessor.feature_columns:
+        return None
+    features = getattr(preprocessor, 'features', None)
+    inputs = features.input_columns if features is not None else []
+    return list(dict.fromkeys(list(preprocessor.feature_columns) + inputs + [ID_COLUMN]))
+
+
+class SpooledUpload:
+    """
+    Vuelca el archivo subido a un archivo temporal cuando supera
+    UPLOAD_SPOOL_THRESHOLD, para poder mapearlo en memoria en lugar de
+    copiar el cuerpo completo de la petición.
+    """
+
+    def __init__(self, file_storage, threshold=UPLOAD_SPOOL_THRESHOLD):
+        self.file = file_storage
+        self.threshold = threshold
+        self.path = None
+        self._buffer = None
+
+    def __enter__(self):
+        stream = self.file.stream
+        size = self.file.content_length or _stream_size(stream)
+
+        if size is not None and size <= self.threshold:
+            self._buffer = pa.py_buffer(stream.read())
+            return self
+
+        fd, self.path = tempfile.mkstemp(suffix=os.path.splitext(self.file.filename)[1])
+        with os.fdopen(fd, 'wb') as out:
+            shutil.copyfileobj(stream, out, length=1024 * 1024)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except OSError:
+                # En Windows el archivo sigue abierto mientras exista el mapeo
+                pass
+        self._buffer = None
+
+    def source(self):
+        """
+        Fuente Arrow de solo lectura: memoria mapeada o buffer en memoria.
+        """
+        if self.path is not None:
+            return pa.memory_map(self.path, 'r')
+        return pa.BufferReader(self._buffer)
+
+    def text_source(self):
+        if self.path is not None:
+            return self.path
+        return pa.BufferReader(self._buffer)
+
+
+def _stream_size(stream):
+    try:
+        pos = stream.tell()
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell()
+        stream.seek(pos)
+        return size
+    except (AttributeError, OSError):
+        return None
+
+
+def _select(table, columns):
+    if columns is None:
+        return table
+    return table.select([col for col in columns if col in table.column_names])
+
+
+def read_parquet_table(source, columns=None):
+    """
+    Lee solo las columnas pedidas: las demás nunca se decodifican.
+    """
+    parquet_file = pq.ParquetFile(source)
+    if columns is not None:
+        available = set(parquet_file.schema_arrow.names)
+        columns = [col for col in columns if col in available]
+    return parquet_file.read(columns=columns)
+
+
+def read_arrow_table(source, columns=None):
+    """
+    Acepta tanto el formato IPC de stream como el de archivo (Feather v2).
+    Con memoria mapeada las columnas descartadas no se llegan a leer.
+    """
+    try:
+        table = ipc.open_file(source).read_all()
+    except pa.ArrowInvalid:
+        source.seek(0)
+        table = ipc.open_stream(source).read_all()
+    return _select(table, columns)
+
+
+def table_to_frame(table):
+    """
+    Convierte una tabla Arrow a DataFrame sin pasar por columnas object:
+    las numéricas se comparten con Arrow cuando no tienen nulos y las de
+    texto se convierten a Categorical desde su codificación de diccionario.
+    """
+    arrays = []
+    for column in table.columns:
+        if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            column = column.dictionary_encode()
+        arrays.append(column)
+    table = pa.table(arrays, names=table.column_names)
+    return table.to_pandas(split_blocks=True)
+
+
+def read_upload(file_storage, columns=None):
+    """
+    Lee un archivo subido (CSV, Parquet o Arrow IPC) proyectando `columns`.
+    """
+    filename = file_storage.filename.lower()
+
+    with SpooledUpload(file_storage) as upload:
+        if filename.endswith(CSV_EXTENSIONS):
+            wanted = None if columns is None else set(columns)
+            usecols = None if wanted is None else (lambda col: col in wanted)
+            return pd.read_csv(upload.text_source(), usecols=usecols)
+        if filename.endswith(PARQUET_EXTENSIONS):
+            return table_to_frame(read_parquet_table(upload.source(), columns))
+        if filename.endswith(ARROW_EXTENSIONS):
+            return table_to_frame(read_arrow_table(upload.source(), columns))
+
+    raise ValueError('Formato no soportado. Use CSV, Parquet o Arrow')
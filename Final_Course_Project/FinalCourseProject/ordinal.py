@@ -0,0 +1,119 @@
+import numpy as np
+
+# Cortes iniciales para sii 0..3 sobre una puntuación continua
+DEFAULT_THRESHOLDS = (0.5, 1.5, 2.5)
+
+
+def quadratic_weights(n_classes):
+    i = np.arange(n_classes)
+    return (i[:, None] - i[None, :]) ** 2 / (n_classes - 1) ** 2
+
+
+def confusion_matrix(y_true, y_pred, n_classes):
+    index = np.asarray(y_true, dtype=np.int64) * n_classes + np.asarray(y_pred, dtype=np.int64)
+    return np.bincount(index, minlength=n_classes * n_classes).reshape(n_classes, n_classes)
+
+
+def quadratic_weighted_kappa(y_true, y_pred, n_classes=4):
+    """QWK a partir de la matriz de confusión (misma definición que cohen_kappa_score)."""
+    conf = confusion_matrix(y_true, y_pred, n_classes).astype(np.float64)
+    n = conf.sum()
+    if n == 0:
+        return 0.0
+    weights = quadratic_weights(n_classes)
+    expected = np.outer(conf.sum(axis=1), conf.sum(axis=0)) / n
+    denominator = (weights * expected).sum()
+    return float(1.0 - (weights * conf).sum() / denominator) if denominator else 0.0
+
+
+def apply_thresholds(scores, thresholds):
+    """Clase = número de cortes estrictamente por debajo de la puntuación."""
+    return np.searchsorted(np.asarray(thresholds, dtype=np.float64), scores, side='left')
+
+
+def optimize_thresholds(scores, y_true, n_classes=4, initial=DEFAULT_THRESHOLDS, max_rounds=20):
+    """
+    Cortes que maximizan el QWK, por ascenso coordenado.
+
+    Las puntuaciones se ordenan una sola vez. Para el corte k, con los demás
+    fijos, solo se mueven las muestras entre los cortes k-1 y k+1, y cada
+    posición candidata pasa una muestra de la clase k+1 a la k. Eso cambia
+    una celda de la matriz de confusión y una cuenta de predicciones, así
+    que el numerador y el denominador del QWK de todos los candidatos salen
+    de una suma acumulada: cada barrido es O(n) y la matriz no se recalcula
+    para cada candidato.
+
+    Devuelve (thresholds, qwk).
+    """
+    order = np.argsort(scores, kind='stable')
+    s = np.asarray(scores, dtype=np.float64)[order]
+    y = np.asarray(y_true, dtype=np.int64)[order]
+    n = len(s)
+    if n == 0:
+        return np.asarray(initial, dtype=np.float64), 0.0
+
+    weights = quadratic_weights(n_classes)
+    true_counts = np.bincount(y, minlength=n_classes)
+    # Denominador = sum_j pred_counts[j] * v[j] / n
+    v = weights.T @ true_counts
+
+    thresholds = np.asarray(initial, dtype=np.float64).copy()
+    best = quadratic_weighted_kappa(y, apply_thresholds(s, thresholds), n_classes)
+
+    for _ in range(max_rounds):
+        improved = False
+        for k in range(n_classes - 1):
+            lower = thresholds[k - 1] if k > 0 else -np.inf
+            upper = thresholds[k + 1] if k + 1 < len(thresholds) else np.inf
+            lo = np.searchsorted(s, lower, side='right')
+            hi = np.searchsorted(s, upper, side='right')
+            if hi <= lo:
+                continue
+
+            # Punto de partida: toda la ventana en la clase k+1
+            pred = apply_thresholds(s, thresholds)
+            pred[lo:hi] = k + 1
+            conf = confusion_matrix(y, pred, n_classes)
+            window = y[lo:hi]
+            numerator = (weights * conf).sum()
+            denominator = conf.sum(axis=0) @ v / n
+
+            # Candidato m: las m primeras muestras de la ventana pasan a la clase k
+            m = np.arange(hi - lo + 1)
+            num = numerator + np.concatenate([[0.0], np.cumsum(weights[window, k] - weights[window, k + 1])])
+            den = denominator + m * (v[k] - v[k + 1]) / n
+            with np.errstate(divide='ignore', invalid='ignore'):
+                qwk = np.where(den > 0, 1.0 - num / den, -np.inf)
+
+            # Con empates solo se puede cortar donde cambia la puntuación
+            values = s[lo:hi]
+            valid = np.ones(len(m), dtype=bool)
+            valid[1:-1] = values[1:] > values[:-1]
+            qwk[~valid] = -np.inf
+
+            candidate = int(np.argmax(qwk))
+            if qwk[candidate] > best + 1e-12:
+                best = float(qwk[candidate])
+                left = values[candidate - 1] if candidate > 0 else lower
+                right = values[candidate] if candidate < len(values) else upper
+                if np.isinf(left):
+                    left = right - 1.0
+                if np.isinf(right):
+                    right = left + 1.0
+                thresholds[k] = (left + right) / 2.0
+                improved = True
+        if not improved:
+            break
+
+    return thresholds, best
+
+
+def ordinal_probabilities(scores, thresholds, scale):
+    """
+    Probabilidades por clase de un modelo logístico acumulado:
+    P(clase > k) = sigmoid((score - t_k) / scale).
+    """
+    scores = np.asarray(scores, dtype=np.float64).reshape(-1, 1)
+    above = 1.0 / (1.0 + np.exp(-(scores - np.asarray(thresholds)[None, :]) / scale))
+    cumulative = np.hstack([np.ones((len(scores), 1)), above, np.zeros((len(scores), 1))])
+    return np.clip(cumulative[:, :-1] - cumulative[:, 1:], 0.0, 1.0)
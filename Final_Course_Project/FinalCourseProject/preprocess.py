@@ -4,6 +4,8 @@ from sklearn.preprocessing import LabelEncoder
 from sklearn.impute import SimpleImputer
 import warnings
 
+from features import model_pipeline
+
 warnings.filterwarnings('ignore')
 
 
@@ -14,11 +16,27 @@ class DataPreprocessor:
         self.feature_columns = None
         self.categorical_columns = None
         self.numeric_columns = None
+        # Columnas derivadas (features.py), calculadas antes de imputar y codificar
+        self.features = model_pipeline()
 
     def fit(self, df, target_column='sii'):
         """
         Ajusta el preprocesador con los datos de entrenamiento
         """
+        return self._fit_columns(self.engineer(df, fit=True), target_column)
+
+    def engineer(self, df, fit=False):
+        """
+        Añade las columnas derivadas (features.py) a un DataFrame o dict de
+        columnas en bruto. Es la entrada que ven el modelo y el monitor de deriva.
+        """
+        # Los preprocesadores guardados antes del pipeline no lo tienen
+        features = getattr(self, 'features', None)
+        if features is None:
+            return df
+        return features.fit_transform(df) if fit else features.transform(df)
+
+    def _fit_columns(self, df, target_column):
         self.categorical_columns = df.select_dtypes(include=['object']).columns.tolist()
         self.numeric_columns = df.select_dtypes(include=['int64', 'float64']).columns.tolist()
 
@@ -47,33 +65,52 @@ class DataPreprocessor:
         """
         Transforma los datos manteniendo el mismo esquema de columnas del entrenamiento.
         """
-        df = df.copy()
-
-        # Asegurar numéricas
-        for col in self.numeric_columns:
-            if col not in df.columns:
-                df[col] = np.nan
+        return self._transform_columns(self.engineer(df))
 
-        # Asegurar categóricas
-        for col in self.categorical_columns:
-            if col not in df.columns:
-                df[col] = 'missing'
+    def _transform_columns(self, df):
+        columns = {}
 
-        # Imputar numéricas
+        # Imputar numéricas (las ausentes se crean vacías, sin copiar df completo)
         if self.numeric_columns:
-            df[self.numeric_columns] = self.imputer.transform(df[self.numeric_columns])
+            numeric = pd.DataFrame(
+                {col: df[col] if col in df.columns else np.nan for col in self.numeric_columns},
+                index=df.index
+            )
+            imputed = self.imputer.transform(numeric)
+            for i, col in enumerate(self.numeric_columns):
+                columns[col] = imputed[:, i]
 
         # Codificar categóricas
         for col in self.categorical_columns:
-            le = self.label_encoders[col]
-            series = df[col].fillna('missing').astype(str)
-            series = series.apply(lambda x: x if x in le.classes_ else 'missing')
-            df[col] = le.transform(series)
+            if col in df.columns:
+                columns[col] = self._encode_column(col, df[col])
+            else:
+                columns[col] = self._encode_column(col, pd.Series('missing', index=df.index))
+
+        return pd.DataFrame(columns, index=df.index)[self.numeric_columns + self.categorical_columns]
+
+    def _encode_column(self, col, series):
+        """
+        Codifica una columna categórica trabajando sobre sus valores únicos:
+        cada categoría se resuelve una sola vez y luego se indexa por código.
+        Acepta columnas object, string o Categorical (p. ej. desde Arrow).
+        """
+        le = self.label_encoders[col]
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+
+        known = set(le.classes_)
+        values = [str(v) if str(v) in known else 'missing' for v in uniques]
+        if (codes < 0).any():
+            # El código -1 (NaN) apunta al último elemento de lookup
+            values.append('missing')
 
-        return df[self.numeric_columns + self.categorical_columns]
+        lookup = le.transform(np.array(values, dtype=object))
+        return lookup[codes]
 
     def fit_transform(self, df, target_column='sii'):
-        return self.fit(df, target_column).transform(df)
+        # El pipeline de variables derivadas se aplica una sola vez
+        engineered = self.engineer(df, fit=True)
+        return self._fit_columns(engineered, target_column)._transform_columns(engineered)
 
     def get_feature_names(self):
         return self.feature_columns
@@ -0,0 +1,189 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+from config import RESULTS_DIR, RESULTS_MAX_STORED, RESULTS_CACHE_SIZE
+
+_RESULT_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class ResultNotFound(KeyError):
+    pass
+
+
+class ResultStore:
+    """
+    Guarda cada ejecución de predicción en disco como Parquet (zstd) con un
+    identificador propio, y sirve páginas ordenadas, resumen y descargas sin
+    volver a enviar el resultado completo al navegador.
+    """
+
+    def __init__(self, root=RESULTS_DIR, max_stored=RESULTS_MAX_STORED, cache_size=RESULTS_CACHE_SIZE):
+        self.root = root
+        self.max_stored = max_stored
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        # {result_id: tabla Arrow} y {(result_id, columna, orden): índices ordenados}
+        self._tables = OrderedDict()
+        self._orders = OrderedDict()
+        os.makedirs(self.root, exist_ok=True)
+
+    def save(self, ids, predictions, probabilities):
+        """
+        Persiste una ejecución y devuelve (result_id, resumen).
+        """
+        predictions = np.asarray(predictions).reshape(-1).astype(np.int8)
+        probabilities = np.asarray(probabilities, dtype=np.float32)
+        n_classes = probabilities.shape[1] if probabilities.ndim == 2 else 0
+
+        columns = {
+            'id': pa.array([str(v) for v in ids], type=pa.string()),
+            'prediction': pa.array(predictions),
+        }
+        for k in range(n_classes):
+            columns[f'probability_class_{k}'] = pa.array(probabilities[:, k])
+        if n_classes == 1:
+            # Mismo criterio que la respuesta original: sin clase 1 se repite la 0
+            columns['probability_class_1'] = columns['probability_class_0']
+        columns['confidence'] = pa.array(
+            probabilities.max(axis=1) if n_classes else np.zeros(len(predictions), dtype=np.float32)
+        )
+        table = pa.table(columns)
+
+        # Todas las clases del modelo (sii 0-3), también las que no aparecen
+        counts = np.bincount(predictions.clip(min=0), minlength=max(n_classes, 1))
+        summary = {
+            'records_processed': int(len(predictions)),
+            'class_counts': {str(c): int(n) for c, n in enumerate(counts)},
+            'mean_confidence': float(table['confidence'].to_numpy().mean()) if len(predictions) else 0.0,
+            'created_at': time.time(),
+        }
+
+        result_id = uuid.uuid4().hex
+        directory = os.path.join(self.root, result_id)
+        os.makedirs(directory)
+        pq.write_table(table, os.path.join(directory, 'results.parquet'), compression='zstd')
+        with open(os.path.join(directory, 'summary.json'), 'w') as f:
+            json.dump(summary, f)
+
+        with self.lock:
+            self._remember_table(result_id, table)
+        self._prune()
+        return result_id, summary
+
+    def summary(self, result_id):
+        with open(os.path.join(self._directory(result_id), 'summary.json')) as f:
+            return json.load(f)
+
+    def page(self, result_id, page=1, page_size=100, sort=None, order='asc'):
+        """
+        Devuelve una página (1-indexada) como lista de dicts, ordenada en el
+        servidor por cualquiera de las columnas guardadas.
+        """
+        table = self._table(result_id)
+        if sort is not None and sort not in table.column_names:
+            raise ValueError(f'No se puede ordenar por {sort}')
+
+        total = table.num_rows
+        start = max(page - 1, 0) * page_size
+        stop = min(start + page_size, total)
+
+        if sort is None or start >= total:
+            rows = table.slice(start, max(stop - start, 0))
+        else:
+            indices = self._order(result_id, table, sort, order)
+            rows = table.take(pa.array(indices[start:stop]))
+
+        return {
+            'result_id': result_id,
+            'page': page,
+            'page_size': page_size,
+            'total': total,
+            'pages': (total + page_size - 1) // page_size,
+            'sort': sort,
+            'order': order,
+            'rows': rows.to_pylist(),
+        }
+
+    def parquet_path(self, result_id):
+        return os.path.join(self._directory(result_id), 'results.parquet')
+
+    def csv_stream(self, result_id, batch_size=50_000):
+        """
+        Genera el CSV por lotes para no construirlo entero en memoria.
+        """
+        table = self._table(result_id)
+        header = True
+        for batch in table.to_batches(max_chunksize=batch_size):
+            sink = pa.BufferOutputStream()
+            pacsv.write_csv(pa.Table.from_batches([batch]), sink,
+                            write_options=pacsv.WriteOptions(include_header=header))
+            header = False
+            yield sink.getvalue().to_pybytes()
+
+    def _directory(self, result_id):
+        if not _RESULT_ID.match(result_id or ''):
+            raise ResultNotFound(result_id)
+        directory = os.path.join(self.root, result_id)
+        if not os.path.isdir(directory):
+            raise ResultNotFound(result_id)
+        return directory
+
+    def _table(self, result_id):
+        with self.lock:
+            if result_id in self._tables:
+                self._tables.move_to_end(result_id)
+                return self._tables[result_id]
+        table = pq.read_table(self.parquet_path(result_id), memory_map=True)
+        with self.lock:
+            self._remember_table(result_id, table)
+        return table
+
+    def _order(self, result_id, table, sort, order):
+        key = (result_id, sort, order)
+        with self.lock:
+            if key in self._orders:
+                self._orders.move_to_end(key)
+                return self._orders[key]
+
+        values = table[sort].to_numpy(zero_copy_only=False)
+        indices = np.argsort(values, kind='stable')
+        if order == 'desc':
+            indices = indices[::-1]
+
+        with self.lock:
+            self._orders[key] = indices
+            while len(self._orders) > self.cache_size * 2:
+                self._orders.popitem(last=False)
+        return indices
+
+    def _remember_table(self, result_id, table):
+        self._tables[result_id] = table
+        self._tables.move_to_end(result_id)
+        while len(self._tables) > self.cache_size:
+            self._tables.popitem(last=False)
+
+    def _prune(self):
+        """
+        Conserva en disco solo las RESULTS_MAX_STORED ejecuciones más recientes.
+        """
+        entries = [os.path.join(self.root, name) for name in os.listdir(self.root)
+                   if _RESULT_ID.match(name)]
+        entries.sort(key=os.path.getmtime, reverse=True)
+        for directory in entries[self.max_stored:]:
+            result_id = os.path.basename(directory)
+            with self.lock:
+                self._tables.pop(result_id, None)
+                for key in [k for k in self._orders if k[0] == result_id]:
+                    del self._orders[key]
+            shutil.rmtree(directory, ignore_errors=True)
@@ -1,6 +1,24 @@
 // Variables globales
 let selectedFile = null;
-let predictions = [];
+
+// Resultado actual: las filas se piden al servidor por páginas
+const ROW_OVERSCAN = 10;
+let currentResult = null;
+let pageCache = new Map();
+let pendingPages = new Set();
+let rowHeight = 45;
+
+// Niveles de sii (0-3) con su etiqueta y estilo
+const SII_LEVELS = [
+    { label: 'Ninguno', badge: 'badge-negative', value: 'negative' },
+    { label: 'Leve', badge: 'badge-mild', value: 'mild' },
+    { label: 'Moderado', badge: 'badge-moderate', value: 'moderate' },
+    { label: 'Grave', badge: 'badge-positive', value: 'positive' }
+];
+
+function siiLevel(level) {
+    return SII_LEVELS[level] || { label: `Clase ${level}`, badge: '', value: '' };
+}
 
 // Elementos del DOM
 const uploadArea = document.getElementById('uploadArea');
@@ -10,7 +28,11 @@ const loadingOverlay = document.getElementById('loadingOverlay');
 const loadingText = document.getElementById('loadingText');
 const predictionsSection = document.getElementById('predictionsSection');
 const tableBody = document.getElementById('tableBody');
+const tableHead = document.getElementById('tableHead');
+const predictionsSummary = document.getElementById('predictionsSummary');
+const tableWrapper = document.getElementById('tableWrapper');
 const downloadBtn = document.getElementById('downloadBtn');
+const downloadParquetBtn = document.getElementById('downloadParquetBtn');
 
 // Event Listeners para upload
 uploadArea.addEventListener('click', () => fileInput.click());
@@ -39,8 +61,9 @@ fileInput.addEventListener('change', (e) => {
 function handleFile(file) {
     if (!file) return;
     
-    if (!file.name.endsWith('.csv') && !file.name.endsWith('.parquet')) {
-        showError('Solo se aceptan archivos CSV o Parquet');
+    const supported = ['.csv', '.parquet', '.arrow', '.arrows', '.ipc', '.feather'];
+    if (!supported.some(ext => file.name.toLowerCase().endsWith(ext))) {
+        showError('Solo se aceptan archivos CSV, Parquet o Arrow');
         return;
     }
     
@@ -72,11 +95,11 @@ predictBtn.addEventListener('click', async () => {
         
         if (!response.ok) {
             const error = await response.json();
-            throw new Error(error.error || 'Error en la predicción');
+            const retry = error.retry_after ? ` (reintente en ${error.retry_after} s)` : '';
+            throw new Error((error.error || 'Error en la predicción') + retry);
         }
         
         const data = await response.json();
-        predictions = data.predictions;
         
         // Mostrar resultados
         displayPredictions(data);
@@ -94,37 +117,187 @@ predictBtn.addEventListener('click', async () => {
 function displayPredictions(data) {
     predictionsSection.style.display = 'block';
     
-    // Actualizar resumen
-    document.getElementById('recordsProcessed').textContent = data.records_processed;
-    document.getElementById('recordsCount').textContent = `${data.records_processed} registros`;
+    // Resumen calculado en el servidor
+    const summary = data.summary;
+    document.getElementById('recordsProcessed').textContent = summary.records_processed;
+    document.getElementById('recordsCount').textContent = `${summary.records_processed} registros`;
     
-    const positiveCount = predictions.filter(p => p.prediction === 1).length;
-    const negativeCount = predictions.filter(p => p.prediction === 0).length;
+    // Las clases del resultado salen de class_counts: una tarjeta y una
+    // columna de probabilidad por cada una
+    const classes = Object.keys(summary.class_counts).map(Number).sort((a, b) => a - b);
+    renderClassCounts(summary.class_counts, classes);
+    renderTableHead(classes);
     
-    document.getElementById('positiveCount').textContent = positiveCount;
-    document.getElementById('negativeCount').textContent = negativeCount;
+    // La primera página llega con la respuesta de /api/predict
+    currentResult = {
+        id: data.result_id,
+        classes,
+        total: summary.records_processed,
+        pageSize: data.page_size,
+        sort: null,
+        order: 'asc'
+    };
+    resetPages();
+    pageCache.set(1, data.predictions);
+    tableWrapper.scrollTop = 0;
+    renderVisibleRows();
     
-    // Llenar tabla
-    tableBody.innerHTML = '';
-    predictions.forEach(pred => {
-        const row = document.createElement('tr');
-        const predictionText = pred.prediction === 1 ? 'Sí (Problemático)' : 'No (Normal)';
-        const badgeClass = pred.prediction === 1 ? 'badge-positive' : 'badge-negative';
-        
-        row.innerHTML = `
-            <td>${pred.id}</td>
-            <td><span class="prediction-badge ${badgeClass}">${predictionText}</span></td>
-            <td>${(pred.probability_class_0 * 100).toFixed(2)}%</td>
-            <td>${(pred.probability_class_1 * 100).toFixed(2)}%</td>
-            <td>${(pred.confidence * 100).toFixed(2)}%</td>
+    // Scroll a resultados
+    predictionsSection.scrollIntoView({ behavior: 'smooth' });
+}
+
+function renderClassCounts(classCounts, classes) {
+    predictionsSummary.querySelectorAll('.class-count').forEach(card => card.remove());
+    classes.forEach(level => {
+        const { label, value } = siiLevel(level);
+        const card = document.createElement('div');
+        card.className = 'summary-card class-count';
+        card.innerHTML = `
+            <span class="summary-label">sii ${level} · ${label}</span>
+            <span class="summary-value ${value}">${classCounts[level]}</span>
         `;
-        tableBody.appendChild(row);
+        predictionsSummary.appendChild(card);
     });
+}
+
+function renderTableHead(classes) {
+    const probabilityHeaders = classes.map(level =>
+        `<th data-sort="probability_class_${level}">Prob. ${siiLevel(level).label}</th>`
+    ).join('');
+    tableHead.innerHTML = `
+        <th data-sort="id">ID</th>
+        <th data-sort="prediction">Predicción</th>
+        ${probabilityHeaders}
+        <th data-sort="confidence">Confianza</th>
+    `;
+}
+
+function resetPages() {
+    pageCache = new Map();
+    pendingPages = new Set();
+}
+
+// Pide una página al servidor (una sola vez por página)
+async function fetchPage(page) {
+    if (!currentResult || pageCache.has(page) || pendingPages.has(page)) return;
+    pendingPages.add(page);
     
-    // Scroll a resultados
-    predictionsSection.scrollIntoView({ behavior: 'smooth' });
+    const result = currentResult;
+    const params = new URLSearchParams({ page, page_size: result.pageSize });
+    if (result.sort) {
+        params.set('sort', result.sort);
+        params.set('order', result.order);
+    }
+    
+    try {
+        const response = await fetch(`/api/results/${result.id}?${params}`);
+        const data = await response.json();
+        // Ignorar respuestas de un resultado u orden anterior
+        if (result !== currentResult) return;
+        if (data.status === 'success') {
+            pageCache.set(page, data.rows);
+            renderVisibleRows();
+        }
+    } catch (error) {
+        console.error('Error cargando página:', error);
+    } finally {
+        if (result === currentResult) pendingPages.delete(page);
+    }
+}
+
+function getRow(index) {
+    const page = Math.floor(index / currentResult.pageSize) + 1;
+    const rows = pageCache.get(page);
+    if (!rows) {
+        fetchPage(page);
+        return null;
+    }
+    return rows[index % currentResult.pageSize];
 }
 
+function createRow(pred) {
+    const classes = currentResult.classes;
+    const row = document.createElement('tr');
+    if (!pred) {
+        row.innerHTML = `<td colspan="${classes.length + 3}" class="loading-row">Cargando...</td>`;
+        return row;
+    }
+    
+    const { label, badge } = siiLevel(pred.prediction);
+    const probabilities = classes.map(level =>
+        `<td>${(pred[`probability_class_${level}`] * 100).toFixed(2)}%</td>`
+    ).join('');
+    
+    row.innerHTML = `
+        <td>${pred.id}</td>
+        <td><span class="prediction-badge ${badge}">${pred.prediction} (${label})</span></td>
+        ${probabilities}
+        <td>${(pred.confidence * 100).toFixed(2)}%</td>
+    `;
+    return row;
+}
+
+function createSpacer(height) {
+    const spacer = document.createElement('tr');
+    spacer.className = 'spacer-row';
+    spacer.style.height = `${height}px`;
+    return spacer;
+}
+
+// Tabla virtualizada: solo se crean las filas visibles (más un margen)
+function renderVisibleRows() {
+    if (!currentResult) return;
+    
+    const total = currentResult.total;
+    const viewport = tableWrapper.clientHeight || 480;
+    const first = Math.max(0, Math.floor(tableWrapper.scrollTop / rowHeight) - ROW_OVERSCAN);
+    const last = Math.min(total, Math.ceil((tableWrapper.scrollTop + viewport) / rowHeight) + ROW_OVERSCAN);
+    
+    const fragment = document.createDocumentFragment();
+    fragment.appendChild(createSpacer(first * rowHeight));
+    for (let i = first; i < last; i++) {
+        fragment.appendChild(createRow(getRow(i)));
+    }
+    fragment.appendChild(createSpacer((total - last) * rowHeight));
+    
+    tableBody.replaceChildren(fragment);
+    
+    // Ajustar la altura real de fila tras el primer render
+    const sample = tableBody.querySelector('tr:not(.spacer-row)');
+    if (sample && sample.offsetHeight && Math.abs(sample.offsetHeight - rowHeight) > 1) {
+        rowHeight = sample.offsetHeight;
+        renderVisibleRows();
+    }
+}
+
+let scrollScheduled = false;
+tableWrapper.addEventListener('scroll', () => {
+    if (scrollScheduled) return;
+    scrollScheduled = true;
+    requestAnimationFrame(() => {
+        scrollScheduled = false;
+        renderVisibleRows();
+    });
+});
+
+// Ordenar en el servidor al hacer clic en una cabecera (generadas dinámicamente)
+tableHead.addEventListener('click', (e) => {
+    const th = e.target.closest('th[data-sort]');
+    if (!th || !currentResult) return;
+    const column = th.dataset.sort;
+    const order = currentResult.sort === column && currentResult.order === 'asc' ? 'desc' : 'asc';
+    
+    currentResult = { ...currentResult, sort: column, order };
+    tableHead.querySelectorAll('th[data-sort]').forEach(other => {
+        other.classList.remove('sorted-asc', 'sorted-desc');
+    });
+    th.classList.add(`sorted-${order}`);
+    
+    resetPages();
+    tableWrapper.scrollTop = 0;
+    renderVisibleRows();
+});
+
 // Cargar métricas
 async function loadMetrics() {
     try {
@@ -181,26 +354,16 @@ async function loadFeatureImportance() {
     }
 }
 
-// Descargar resultados
-downloadBtn.addEventListener('click', () => {
-    if (predictions.length === 0) return;
-    
-    // Crear CSV
-    let csv = 'ID,Predicción,Probabilidad_No,Probabilidad_Sí,Confianza\n';
-    predictions.forEach(pred => {
-        const predictionText = pred.prediction === 1 ? 'Sí' : 'No';
-        csv += `${pred.id},${predictionText},${(pred.probability_class_0 * 100).toFixed(2)},${(pred.probability_class_1 * 100).toFixed(2)},${(pred.confidence * 100).toFixed(2)}\n`;
-    });
-    
-    // Descargar
-    const blob = new Blob([csv], { type: 'text/csv' });
-    const url = window.URL.createObjectURL(blob);
+// Descargar resultados (generados en el servidor)
+function downloadResults(format) {
+    if (!currentResult) return;
     const a = document.createElement('a');
-    a.href = url;
-    a.download = 'predicciones_' + new Date().getTime() + '.csv';
+    a.href = `/api/results/${currentResult.id}/download?format=${format}`;
     a.click();
-    window.URL.revokeObjectURL(url);
-});
+}
+
+downloadBtn.addEventListener('click', () => downloadResults('csv'));
+downloadParquetBtn.addEventListener('click', () => downloadResults('parquet'));
 
 // Funciones auxiliares
 function showLoading(text) {
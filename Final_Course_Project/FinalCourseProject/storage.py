@@ -0,0 +1,434 @@
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from features import PCIAT_TOTAL, sii_target
+from config import DATABASE_PATH, STORAGE_BATCH_SIZE, STORAGE_WRITE_QUEUE, TARGET_COLUMN, ID_COLUMN
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS labeled_participants (
+    id TEXT PRIMARY KEY,
+    sii INTEGER NOT NULL,
+    features TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_labeled_updated ON labeled_participants(updated_at);
+
+-- Filas etiquetadas que desaparecieron del CSV (cuentan como cambios para reentrenar)
+CREATE TABLE IF NOT EXISTS labeled_deletions (
+    id TEXT NOT NULL,
+    deleted_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_labeled_deletions ON labeled_deletions(deleted_at);
+
+CREATE TABLE IF NOT EXISTS unlabeled_participants (
+    id TEXT PRIMARY KEY,
+    features TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    source TEXT NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS model_versions (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    parent_version INTEGER REFERENCES model_versions(version),
+    created_at REAL NOT NULL,
+    mode TEXT NOT NULL,
+    train_rows INTEGER NOT NULL,
+    data_watermark REAL NOT NULL,
+    rows_changed INTEGER NOT NULL,
+    metrics TEXT,
+    params TEXT
+);
+
+CREATE TABLE IF NOT EXISTS predictions (
+    prediction_id INTEGER PRIMARY KEY,
+    participant_id TEXT NOT NULL,
+    model_version INTEGER REFERENCES model_versions(version),
+    result_id TEXT,
+    prediction INTEGER NOT NULL,
+    probabilities TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_predictions_participant ON predictions(participant_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_predictions_version ON predictions(model_version);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Solo se reescribe una fila si su contenido cambió
+_UPSERT_LABELED = """
+INSERT INTO labeled_participants (id, sii, features, content_hash, updated_at)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+    sii = excluded.sii, features = excluded.features,
+    content_hash = excluded.content_hash, updated_at = excluded.updated_at
+WHERE labeled_participants.content_hash != excluded.content_hash
+"""
+
+_UPSERT_UNLABELED = """
+INSERT INTO unlabeled_participants (id, features, content_hash, source, updated_at)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+    features = excluded.features, content_hash = excluded.content_hash,
+    source = excluded.source, updated_at = excluded.updated_at
+WHERE unlabeled_participants.content_hash != excluded.content_hash
+"""
+
+
+class Storage:
+    """
+    Capa de persistencia local sobre SQLite (modo WAL): participantes con y
+    sin etiqueta, historial de predicciones y linaje de modelos. Todas las
+    tablas están indexadas por id, así que buscar un participante es una
+    búsqueda en un B-tree y no una lectura completa del CSV.
+
+    Cada hilo usa su propia conexión; las escrituras van en lotes con
+    executemany dentro de una transacción. Las escrituras que no deben
+    retrasar una respuesta se encolan con submit() y las aplica un único
+    hilo escritor en segundo plano.
+    """
+
+    def __init__(self, path=DATABASE_PATH, batch_size=STORAGE_BATCH_SIZE, queue_size=STORAGE_WRITE_QUEUE):
+        self.path = path
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.connection().executescript(_SCHEMA)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._writer = threading.Thread(target=self._write_loop, name='storage-writer', daemon=True)
+        self._writer.start()
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    # -- Escrituras en segundo plano --------------------------------------
+
+    def submit(self, method, *args, **kwargs):
+        """
+        Encola `method(*args, **kwargs)` para el hilo escritor y vuelve sin
+        esperar. Si la cola está llena se bloquea hasta que haya sitio, así
+        que las subidas no pueden acumular memoria sin límite.
+        """
+        self._queue.put((method, args, kwargs))
+
+    def flush(self):
+        """Espera a que se apliquen todas las escrituras encoladas."""
+        self._queue.join()
+
+    def _write_loop(self):
+        while True:
+            method, args, kwargs = self._queue.get()
+            try:
+                method(*args, **kwargs)
+            except Exception as e:
+                print(f'⚠️  Escritura en segundo plano fallida ({method.__name__}): {e}')
+            finally:
+                self._queue.task_done()
+
+    # -- Participantes ---------------------------------------------------
+
+    def sync_training_csv(self, data_path, force=False):
+        """
+        Carga el CSV de entrenamiento en las tablas de participantes. Solo
+        se relee si el archivo cambió (tamaño o fecha) desde la última
+        sincronización. Las filas que ya no están en el CSV (o cambiaron de
+        tabla al ganar o perder la etiqueta) se borran. Devuelve
+        {'labeled': filas nuevas o cambiadas, 'unlabeled': ídem,
+        'deleted': etiquetadas borradas} o None si no hubo que leer el archivo.
+        """
+        stat = os.stat(data_path)
+        signature = f'{stat.st_size}:{stat.st_mtime_ns}'
+        if not force and self._get_meta('train_csv_signature') == signature:
+            return None
+
+        df = pd.read_csv(data_path)
+        if ID_COLUMN not in df.columns or (TARGET_COLUMN not in df.columns and PCIAT_TOTAL not in df.columns):
+            raise ValueError(f'Training file must contain columns "{ID_COLUMN}" and "{TARGET_COLUMN}" '
+                             f'(or "{PCIAT_TOTAL}").')
+        df[TARGET_COLUMN] = sii_target(df)
+
+        feature_columns = [c for c in df.columns if c not in (ID_COLUMN, TARGET_COLUMN)]
+        labeled_mask = df[TARGET_COLUMN].notna().to_numpy()
+        labeled, unlabeled = df[labeled_mask], df[~labeled_mask]
+
+        changed = {
+            'labeled': self._upsert(_UPSERT_LABELED, labeled, feature_columns,
+                                    extra=lambda rows: rows[TARGET_COLUMN].astype(int).tolist(), label=True),
+            'unlabeled': self._upsert(_UPSERT_UNLABELED, unlabeled, feature_columns, source='train'),
+            'deleted': self._delete_missing(labeled[ID_COLUMN], unlabeled[ID_COLUMN]),
+        }
+        self._set_meta('train_csv_signature', signature)
+        self._set_meta('feature_columns', json.dumps(feature_columns))
+        return changed
+
+    def save_unlabeled(self, df, source='upload'):
+        """
+        Guarda registros subidos para predecir (requiere columna id) y
+        devuelve cuántos eran nuevos o cambiaron.
+        """
+        if ID_COLUMN not in df.columns or len(df) == 0:
+            return 0
+        feature_columns = [c for c in df.columns if c != ID_COLUMN]
+        return self._upsert(_UPSERT_UNLABELED, df, feature_columns, source=source)
+
+    def _upsert(self, sql, df, feature_columns, extra=None, label=False, source=None):
+        conn = self.connection()
+        now = time.time()
+        total = 0
+        with self._write_lock, conn:
+            for start in range(0, len(df), self.batch_size):
+                chunk = df.iloc[start:start + self.batch_size]
+                ids = chunk[ID_COLUMN].astype(str).tolist()
+                features = _serialize(chunk[feature_columns])
+                hashes = [hashlib.sha1(f.encode()).hexdigest() for f in features]
+                if label:
+                    labels = extra(chunk)
+                    hashes = [hashlib.sha1(f'{y}|{h}'.encode()).hexdigest() for y, h in zip(labels, hashes)]
+                    rows = zip(ids, labels, features, hashes, [now] * len(ids))
+                else:
+                    rows = zip(ids, features, hashes, [source] * len(ids), [now] * len(ids))
+                before = conn.total_changes
+                conn.executemany(sql, rows)
+                total += conn.total_changes - before
+        return total
+
+    def _delete_missing(self, labeled_ids, unlabeled_ids):
+        """
+        Deja las tablas alineadas con el CSV: borra las etiquetadas que ya no
+        están (anotándolas en labeled_deletions) y las no etiquetadas de
+        origen 'train' que ya no están como tales. Las subidas no se tocan.
+        """
+        conn = self.connection()
+        now = time.time()
+        with self._write_lock, conn:
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS csv_ids (id TEXT PRIMARY KEY, labeled INTEGER NOT NULL)')
+            conn.execute('DELETE FROM csv_ids')
+            conn.executemany('INSERT OR REPLACE INTO csv_ids (id, labeled) VALUES (?, ?)',
+                             [(str(v), 1) for v in labeled_ids] + [(str(v), 0) for v in unlabeled_ids])
+            conn.execute('INSERT INTO labeled_deletions (id, deleted_at) '
+                         'SELECT id, ? FROM labeled_participants '
+                         'WHERE id NOT IN (SELECT id FROM csv_ids WHERE labeled = 1)', (now,))
+            deleted = conn.execute('DELETE FROM labeled_participants '
+                                   'WHERE id NOT IN (SELECT id FROM csv_ids WHERE labeled = 1)').rowcount
+            conn.execute("DELETE FROM unlabeled_participants WHERE source = 'train' "
+                         "AND id NOT IN (SELECT id FROM csv_ids WHERE labeled = 0)")
+            conn.execute('DELETE FROM csv_ids')
+        return deleted
+
+    def labeled_data(self):
+        """
+        (X_raw, y, watermark) con todos los participantes etiquetados, con el
+        mismo orden de columnas que el CSV. watermark es la marca de tiempo
+        del último cambio (fila modificada o borrada).
+        """
+        conn = self.connection()
+        rows = conn.execute(
+            'SELECT id, sii, features, updated_at FROM labeled_participants ORDER BY id'
+        ).fetchall()
+        X_raw = _deserialize([r['features'] for r in rows], self._feature_columns())
+        y = pd.Series([r['sii'] for r in rows], name=TARGET_COLUMN, dtype='int64')
+        deleted_at = conn.execute('SELECT MAX(deleted_at) FROM labeled_deletions').fetchone()[0]
+        watermark = max([r['updated_at'] for r in rows] + [deleted_at or 0.0])
+        return X_raw, y, watermark
+
+    def changed_since(self, watermark):
+        """
+        Número de filas etiquetadas nuevas, modificadas o borradas después
+        de `watermark` (usa los índices).
+        """
+        conn = self.connection()
+        changed = conn.execute('SELECT COUNT(*) FROM labeled_participants WHERE updated_at > ?',
+                               (watermark,)).fetchone()[0]
+        deleted = conn.execute('SELECT COUNT(*) FROM labeled_deletions WHERE deleted_at > ?',
+                               (watermark,)).fetchone()[0]
+        return changed + deleted
+
+    def participant(self, participant_id):
+        """
+        Registro de un participante (etiquetado o no) con sus predicciones,
+        o None si no existe.
+        """
+        conn = self.connection()
+        row = conn.execute('SELECT id, sii, features, updated_at FROM labeled_participants WHERE id = ?',
+                           (participant_id,)).fetchone()
+        labeled = row is not None
+        if row is None:
+            row = conn.execute('SELECT id, features, source, updated_at FROM unlabeled_participants WHERE id = ?',
+                               (participant_id,)).fetchone()
+        if row is None:
+            return None
+
+        return {
+            'id': row['id'],
+            'labeled': labeled,
+            'sii': row['sii'] if labeled else None,
+            'features': json.loads(row['features']),
+            'updated_at': row['updated_at'],
+            'predictions': self.prediction_history(participant_id),
+        }
+
+    # -- Predicciones ----------------------------------------------------
+
+    def record_predictions(self, ids, predictions, probabilities, model_version=None, result_id=None):
+        conn = self.connection()
+        now = time.time()
+        ids = [str(v) for v in ids]
+        predictions = np.asarray(predictions).reshape(-1).astype(int).tolist()
+        probabilities = _serialize_rows(np.round(np.asarray(probabilities, dtype=np.float64), 6))
+
+        with self._write_lock, conn:
+            for start in range(0, len(ids), self.batch_size):
+                stop = start + self.batch_size
+                conn.executemany(
+                    'INSERT INTO predictions (participant_id, model_version, result_id, prediction, '
+                    'probabilities, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                    zip(ids[start:stop], [model_version] * (stop - start), [result_id] * (stop - start),
+                        predictions[start:stop], probabilities[start:stop],
+                        [now] * (stop - start))
+                )
+
+    def prediction_history(self, participant_id, limit=20):
+        rows = self.connection().execute(
+            'SELECT model_version, result_id, prediction, probabilities, created_at FROM predictions '
+            'WHERE participant_id = ? ORDER BY created_at DESC LIMIT ?', (participant_id, limit)
+        ).fetchall()
+        return [{**dict(r), 'probabilities': json.loads(r['probabilities'])} for r in rows]
+
+    # -- Linaje de modelos -----------------------------------------------
+
+    def record_model(self, parent_version, mode, train_rows, data_watermark, rows_changed,
+                     metrics=None, params=None):
+        conn = self.connection()
+        with self._write_lock, conn:
+            cursor = conn.execute(
+                'INSERT INTO model_versions (parent_version, created_at, mode, train_rows, '
+                'data_watermark, rows_changed, metrics, params) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (parent_version, time.time(), mode, train_rows, data_watermark, rows_changed,
+                 json.dumps(metrics or {}), json.dumps(params or {}, default=str))
+            )
+        return cursor.lastrowid
+
+    def model(self, version):
+        row = self.connection().execute('SELECT * FROM model_versions WHERE version = ?',
+                                        (version,)).fetchone()
+        return _model_row(row) if row else None
+
+    def lineage(self, limit=50):
+        rows = self.connection().execute(
+            'SELECT * FROM model_versions ORDER BY version DESC LIMIT ?', (limit,)
+        ).fetchall()
+        return [_model_row(r) for r in rows]
+
+    # -- Metadatos -------------------------------------------------------
+
+    def _feature_columns(self):
+        value = self._get_meta('feature_columns')
+        return json.loads(value) if value else None
+
+    def _get_meta(self, key):
+        row = self.connection().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row['value'] if row else None
+
+    def _set_meta(self, key, value):
+        conn = self.connection()
+        with self._write_lock, conn:
+            conn.execute('INSERT INTO meta (key, value) VALUES (?, ?) '
+                         'ON CONFLICT(key) DO UPDATE SET value = excluded.value', (key, value))
+
+
+def _serialize(frame):
+    """
+    Una cadena JSON por fila, igual a json.dumps de su dict pero construida
+    columna a columna: cada valor distinto de una columna se codifica una
+    sola vez y luego solo se concatenan los fragmentos de cada fila. Los
+    floats se escriben con repr (17 cifras significativas si hace falta),
+    así que vuelven exactamente iguales y entrenar desde la base de datos
+    equivale a entrenar desde el CSV.
+    """
+    if len(frame) == 0:
+        return []
+    encoded = [_encode_column(frame[col], json.dumps(str(col)) + ': ') for col in frame.columns]
+    return ['{' + ', '.join(parts) + '}' for parts in zip(*encoded)]
+
+
+def _encode_column(series, key):
+    """Fragmentos '"columna": valor' de una columna (null para los faltantes)."""
+    dtype = series.dtype
+    kind = dtype.kind if isinstance(dtype, np.dtype) else None
+    if kind == 'f':
+        # Por patrón de bits: 0.0 y -0.0 no se confunden
+        values = series.to_numpy(dtype=np.float64)
+        codes, uniques = pd.factorize(values.view(np.int64))
+        codes[np.isnan(values)] = -1
+        uniques = uniques.view(np.float64)
+        # Mismo texto que json.dumps: repr, e Infinity para los infinitos
+        texts = list(map(float.__repr__, uniques.tolist()))
+        for i in np.flatnonzero(np.isinf(uniques)):
+            texts[i] = json.dumps(float(uniques[i]))
+    elif kind in ('i', 'u'):
+        codes, uniques = pd.factorize(series)
+        texts = list(map(str, uniques.tolist()))
+    elif kind == 'b' or pd.api.types.infer_dtype(series, skipna=True) in ('string', 'empty'):
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        texts = [json.dumps(v, default=_json_scalar) for v in np.asarray(uniques, dtype=object).tolist()]
+    else:
+        # Objetos mixtos: factorize igualaría 1, 1.0 y True
+        values = series.astype(object).where(series.notna(), None)
+        return [key + json.dumps(v, default=_json_scalar) for v in values.tolist()]
+
+    fragments = list(map(key.__add__, texts))
+    fragments.append(key + 'null')
+    return np.array(fragments, dtype=object)[codes].tolist()
+
+
+def _serialize_rows(matrix):
+    """Una lista JSON por fila de una matriz de floats finitos (igual que json.dumps)."""
+    columns = [list(map(float.__repr__, column)) for column in matrix.T.tolist()]
+    return ['[' + ', '.join(row) + ']' for row in zip(*columns)]
+
+
+def _json_scalar(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def _deserialize(features, columns=None):
+    if not features:
+        return pd.DataFrame(columns=columns or [])
+    frame = pd.DataFrame.from_records([json.loads(f) for f in features])
+    if columns is not None:
+        frame = frame.reindex(columns=columns)
+    # Columnas que llegan vacías (todo null) vuelven a ser numéricas, como en read_csv
+    for col in frame.columns:
+        if frame[col].isna().all():
+            frame[col] = frame[col].astype('float64')
+    return frame
+
+
+def _model_row(row):
+    data = dict(row)
+    data['metrics'] = json.loads(data['metrics'] or '{}')
+    data['params'] = json.loads(data['params'] or '{}')
+    return data
@@ -1,80 +1,141 @@
 import os
 import pickle
+import threading
 import warnings
 
 import numpy as np
 import pandas as pd
-from catboost import CatBoostClassifier
+from catboost import CatBoostClassifier, CatBoostRegressor
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+from sklearn.model_selection import StratifiedKFold
 
 from preprocess import DataPreprocessor
-from config import MODEL_PATH, TRAIN_DATA_PATH, CATBOOST_ITERATIONS
+from features import FEATURES_VERSION, PCIAT_TOTAL, labeled as labeled_rows
+from training_data import get_quantized_pool
+from inference import InferenceEngine
+from drift import DriftMonitor
+from ordinal import optimize_thresholds, apply_thresholds, quadratic_weighted_kappa
+from config import MODEL_PATH, TRAIN_DATA_PATH, CATBOOST_ITERATIONS, MODEL_MODE, ORDINAL_CV_FOLDS
 
 warnings.filterwarnings("ignore")
 
 
+def load_labeled_data(data_path=TRAIN_DATA_PATH):
+    """
+    Read the training CSV and keep labeled rows only. Missing sii values
+    are derived from the PCIAT total (features.sii_target).
+    Returns (X_raw, y) with id and sii removed from the features.
+    """
+    df = pd.read_csv(data_path)
+    if "sii" not in df.columns and PCIAT_TOTAL not in df.columns:
+        raise ValueError(f'Training file must contain column "sii" or "{PCIAT_TOTAL}".')
+
+    labeled = labeled_rows(df)
+    return labeled.drop(columns=["sii", "id"], errors="ignore"), labeled["sii"]
+
+
 class ModelTrainer:
     def __init__(self):
         self.model = None
         self.preprocessor = None
         self.metrics = {}
         self.feature_names = []
-
-    def train(self, data_path=TRAIN_DATA_PATH):
+        self.engine = None
+        self.drift_baseline = None
+        # Regression mode only: {"thresholds", "scale", "oof_qwk"}
+        self.ordinal = None
+        # Lineage in the storage layer (None when trained without it)
+        self.model_version = None
+        self.data_watermark = None
+        # Guards the swap of a newly trained model against serving snapshots
+        self._swap_lock = threading.Lock()
+
+    def train(self, data_path=TRAIN_DATA_PATH, mode=MODEL_MODE, storage=None):
         """
         Train CatBoost model using labeled rows (sii not NaN).
+        mode="classifier" fits a multiclass model; mode="ordinal" fits a
+        regressor on sii and QWK-optimal cut-points (see _fit_ordinal).
+        With a Storage, data_path is synced into the database first, rows are
+        read from it and the new model is recorded in the lineage table.
         """
         try:
-            print(f"📥 Loading training data from {data_path}...")
-            df = pd.read_csv(data_path)
-
-            if "sii" not in df.columns:
-                return False, 'Training file must contain column "sii".'
-
-            # Use only labeled rows
-            labeled = df.dropna(subset=["sii"]).copy()
-            labeled["sii"] = labeled["sii"].astype(int)
-
-            # Features
-            X_raw = labeled.drop(columns=["sii", "id"], errors="ignore")
-            y = labeled["sii"]
+            watermark = None
+            try:
+                if storage is not None:
+                    print(f"📥 Loading training data from {storage.path}...")
+                    storage.sync_training_csv(data_path)
+                    X_raw, y, watermark = storage.labeled_data()
+                else:
+                    print(f"📥 Loading training data from {data_path}...")
+                    X_raw, y = load_labeled_data(data_path)
+            except ValueError as e:
+                return False, str(e)
 
             print(f"✅ Labeled data: {X_raw.shape}")
             print(f"📊 Target distribution: {y.value_counts().to_dict()}")
 
-            # Preprocess
-            self.preprocessor = DataPreprocessor()
-            X = self.preprocessor.fit_transform(X_raw)
+            # Everything is built in locals and swapped in at the end, so
+            # requests served during training keep using the current model.
+            preprocessor = DataPreprocessor()
+            X = preprocessor.fit_transform(X_raw)
+
+            # Baseline sketches for drift monitoring of incoming uploads
+            # (same engineered columns the model sees, derived ones included)
+            drift_baseline = DriftMonitor.from_training_data(preprocessor.engineer(X_raw), preprocessor).baseline
 
             # Save feature names for feature importance
-            self.feature_names = list(X.columns)
+            feature_names = list(X.columns)
+
+            # float32 feature matrix, quantized once and reused across retrains
+            pool = get_quantized_pool(X, y)
+            del X
 
             # Train model
-            print(f"\n🤖 Training CatBoost (iterations: {CATBOOST_ITERATIONS})...")
-            self.model = CatBoostClassifier(
-                iterations=CATBOOST_ITERATIONS,
-                verbose=False,
-                random_state=42,
-                task_type="CPU",
-                allow_writing_files=False
-            )
-            self.model.fit(X, y)
+            print(f"\n🤖 Training CatBoost {mode} (iterations: {CATBOOST_ITERATIONS})...")
+            if mode == "ordinal":
+                model, ordinal = self._fit_ordinal(pool, y.to_numpy())
+                y_pred = apply_thresholds(model.predict(pool), ordinal["thresholds"])
+            elif mode == "classifier":
+                model = self._fit_classifier(pool, y)
+                ordinal = None
+                y_pred = np.asarray(model.predict(pool)).reshape(-1).astype(int)
+            else:
+                raise ValueError(f"Unknown model mode: {mode}")
+            engine = InferenceEngine(model, preprocessor, ordinal=ordinal)
 
             # Evaluate (simple: on training set, consistent with your current app flow)
-            y_pred = self.model.predict(X)
-
-            self.metrics = {
+            metrics = {
                 "accuracy": float(accuracy_score(y, y_pred)),
                 "precision": float(self._safe_precision(y, y_pred)),
                 "recall": float(self._safe_recall(y, y_pred)),
                 "f1": float(self._safe_f1(y, y_pred)),
+                "qwk": quadratic_weighted_kappa(y, y_pred),
                 "roc_auc": 0.0  # kept as 0.0 to avoid multi-class ROC issues
             }
+            if ordinal is not None:
+                metrics["oof_qwk"] = ordinal["oof_qwk"]
 
             print("\n📈 Model metrics:")
-            for metric, value in self.metrics.items():
+            for metric, value in metrics.items():
                 print(f"   {metric}: {value:.4f}")
 
+            model_version, data_watermark = self.model_version, self.data_watermark
+            if storage is not None:
+                rows_changed = storage.changed_since(data_watermark or 0.0)
+                model_version = storage.record_model(
+                    model_version, mode, len(y), watermark, rows_changed,
+                    metrics=metrics, params={**self._catboost_params(), "ordinal": ordinal}
+                )
+                data_watermark = watermark
+                print(f"🧬 Model version {model_version} ({rows_changed} new or changed rows)")
+
+            # Swap in the new model in a single assignment
+            with self._swap_lock:
+                (self.model, self.preprocessor, self.engine, self.ordinal, self.metrics,
+                 self.feature_names, self.drift_baseline, self.model_version, self.data_watermark) = (
+                    model, preprocessor, engine, ordinal, metrics,
+                    feature_names, drift_baseline, model_version, data_watermark)
+
             # Save model
             self.save_model(MODEL_PATH)
             print(f"\n✅ Model saved at {MODEL_PATH}")
@@ -82,12 +143,65 @@ class ModelTrainer:
             return True, self.metrics
 
         except Exception as e:
+            # The previous model (if any) stays in service
             print(f"❌ Training error: {str(e)}")
             import traceback
             traceback.print_exc()
-            self.model = None
             return False, str(e)
 
+    def has_new_data(self, storage):
+        """
+        True if labeled rows were added or changed after this model was trained.
+        """
+        if self.data_watermark is None:
+            return True
+        return storage.changed_since(self.data_watermark) > 0
+
+    def _fit_classifier(self, pool, y):
+        """
+        Fit a CatBoostClassifier on a quantized pool.
+
+        Pools read back from the disk cache carry float labels; passing the
+        class names explicitly keeps classes_ (and predictions) integer.
+        """
+        model = CatBoostClassifier(class_names=sorted(int(c) for c in pd.unique(y)),
+                                   **self._catboost_params())
+        model.fit(pool)
+        return model
+
+    def _catboost_params(self):
+        return dict(
+            iterations=CATBOOST_ITERATIONS,
+            verbose=False,
+            random_state=42,
+            task_type="CPU",
+            allow_writing_files=False
+        )
+
+    def _fit_ordinal(self, pool, y):
+        """
+        Regress sii, then choose the three cut-points that maximize QWK.
+        Thresholds are tuned on out-of-fold predictions; in-sample scores
+        would overfit them. The final regressor is refit on all rows.
+        Returns (model, ordinal).
+        """
+        oof = np.zeros(len(y))
+        folds = StratifiedKFold(n_splits=ORDINAL_CV_FOLDS, shuffle=True, random_state=42)
+        for train_idx, valid_idx in folds.split(np.zeros(len(y)), y):
+            fold_model = CatBoostRegressor(**self._catboost_params())
+            fold_model.fit(pool.slice(train_idx))
+            oof[valid_idx] = fold_model.predict(pool.slice(valid_idx))
+
+        thresholds, oof_qwk = optimize_thresholds(oof, y)
+        # Logistic scale with the same variance as the out-of-fold residuals
+        scale = max(float(np.std(oof - y)), 1e-3) * np.sqrt(3.0) / np.pi
+        ordinal = {"thresholds": thresholds.tolist(), "scale": scale, "oof_qwk": oof_qwk}
+        print(f"📏 Thresholds: {np.round(thresholds, 3).tolist()} (out-of-fold QWK {oof_qwk:.4f})")
+
+        model = CatBoostRegressor(**self._catboost_params())
+        model.fit(pool)
+        return model, ordinal
+
     def _safe_precision(self, y_true, y_pred):
         try:
             return precision_score(y_true, y_pred, average="weighted", zero_division=0)
@@ -114,24 +228,50 @@ class ModelTrainer:
 
     def predict(self, X):
         """
-        Predict using already-preprocessed features (DataFrame).
+        Predict using already-preprocessed features (DataFrame or float32 matrix
+        from transform()). Labels and probabilities come from a single raw
+        prediction pass of the inference engine.
         Returns (predictions, probabilities).
         """
         if self.model is None:
             raise ValueError("Model not trained. Call train() first.")
 
-        predictions = self.model.predict(X)
+        return self._get_engine().predict(X)
 
-        try:
-            probabilities = self.model.predict_proba(X)
-        except Exception as e:
-            print(f"⚠️  Error getting probabilities: {e}")
-            # Fallback: create fake probs (won't happen normally)
-            probabilities = np.zeros((len(predictions), 4), dtype=float)
-            for i, p in enumerate(predictions):
-                probabilities[i, int(p)] = 1.0
+    def transform(self, columns):
+        """
+        Serving-time preprocessing: raw columns (DataFrame or dict of arrays)
+        to the float32 feature matrix, without pandas or sklearn.
+        """
+        if self.model is None:
+            raise ValueError("Model not trained. Call train() first.")
+
+        return self._get_engine().transform(columns)
 
-        return predictions, probabilities
+    def serving_engine(self):
+        """
+        Consistent (engine, model_version) snapshot for one request, or
+        (None, None) if no model is trained. A retrain finishing mid-request
+        does not mix the old preprocessor with the new model.
+        """
+        with self._swap_lock:
+            if self.model is None:
+                return None, None
+            return self._get_engine(), self.model_version
+
+    def _get_engine(self):
+        if self.engine is None:
+            self.engine = InferenceEngine(self.model, self.preprocessor, ordinal=self.ordinal)
+        return self.engine
+
+    def build_drift_baseline(self, data_path=TRAIN_DATA_PATH):
+        """
+        Rebuild the drift baseline for models saved before it was stored.
+        """
+        X_raw, _ = load_labeled_data(data_path)
+        self.drift_baseline = DriftMonitor.from_training_data(
+            self.preprocessor.engineer(X_raw), self.preprocessor).baseline
+        return self.drift_baseline
 
     def get_feature_importance(self):
         """
@@ -159,22 +299,41 @@ class ModelTrainer:
                     "model": self.model,
                     "preprocessor": self.preprocessor,
                     "metrics": self.metrics,
-                    "feature_names": self.feature_names
+                    "feature_names": self.feature_names,
+                    "drift_baseline": self.drift_baseline,
+                    "ordinal": self.ordinal,
+                    "model_version": self.model_version,
+                    "data_watermark": self.data_watermark,
+                    "features_version": FEATURES_VERSION
                 },
                 f
             )
 
     def load_model(self, path):
+        """
+        Load a saved model. Raises ValueError if it was built with a different
+        feature pipeline (or before there was one), since its preprocessor
+        would not produce the columns the current code expects.
+        """
         with open(path, "rb") as f:
             data = pickle.load(f)
+            saved_version = data.get("features_version")
+            if saved_version != FEATURES_VERSION:
+                raise ValueError(f"model built with feature pipeline version {saved_version}, "
+                                 f"current is {FEATURES_VERSION}")
             self.model = data["model"]
             self.preprocessor = data["preprocessor"]
             self.metrics = data.get("metrics", {})
             self.feature_names = data.get("feature_names", [])
+            self.drift_baseline = data.get("drift_baseline")
+            self.ordinal = data.get("ordinal")
+            self.model_version = data.get("model_version")
+            self.data_watermark = data.get("data_watermark")
+        self.engine = None
         return True
 
 
-def train_model_if_needed(train_csv_path=TRAIN_DATA_PATH, model_path=MODEL_PATH):
+def train_model_if_needed(train_csv_path=TRAIN_DATA_PATH, model_path=MODEL_PATH, storage=None):
     """
     This matches app.py expectations:
     returns (success: bool, trainer_or_message)
@@ -186,11 +345,11 @@ def train_model_if_needed(train_csv_path=TRAIN_DATA_PATH, model_path=MODEL_PATH)
             print("✅ Model found. Loading...")
             trainer.load_model(model_path)
             return True, trainer
-        except Exception:
-            print("⚠️ Model load failed. Retraining...")
+        except Exception as e:
+            print(f"⚠️ Model load failed ({e}). Retraining...")
 
     print("📦 Model not found. Training a new one...")
-    ok, res = trainer.train(train_csv_path)
+    ok, res = trainer.train(train_csv_path, storage=storage)
     if not ok:
         return False, res
 
@@ -0,0 +1,100 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+import catboost
+import numpy as np
+from catboost import Pool
+
+from config import (POOL_CACHE_DIR, POOL_CACHE_SIZE,
+                    CATBOOST_BORDER_COUNT, CATBOOST_FEATURE_BORDER_TYPE)
+
+# Pools ya cargados en este proceso: {clave: Pool}, del más antiguo al más reciente
+_memory_cache = OrderedDict()
+
+
+def build_feature_matrix(X):
+    """
+    Matriz de características contigua en float32 (la mitad de memoria que float64).
+    """
+    return np.ascontiguousarray(X.to_numpy(dtype=np.float32, na_value=np.nan))
+
+
+def pool_key(features, labels, feature_names,
+             border_count=CATBOOST_BORDER_COUNT,
+             feature_border_type=CATBOOST_FEATURE_BORDER_TYPE):
+    """
+    Huella de los datos y de la configuración de cuantización.
+    """
+    h = hashlib.sha1()
+    h.update(catboost.__version__.encode())
+    h.update(f"{border_count}|{feature_border_type}".encode())
+    h.update("|".join(feature_names).encode())
+    h.update(str(features.shape).encode())
+    h.update(memoryview(features))
+    h.update(np.ascontiguousarray(labels, dtype=np.int64).tobytes())
+    return h.hexdigest()
+
+
+def get_quantized_pool(X, y,
+                       border_count=CATBOOST_BORDER_COUNT,
+                       feature_border_type=CATBOOST_FEATURE_BORDER_TYPE,
+                       cache_dir=POOL_CACHE_DIR):
+    """
+    Devuelve un Pool cuantizado de CatBoost para (X, y).
+
+    La cuantización se hace una sola vez por combinación de datos y bordes:
+    el resultado se guarda en `cache_dir` y los reentrenamientos posteriores
+    con los mismos datos lo cargan directamente.
+    """
+    feature_names = [str(col) for col in X.columns]
+    features = build_feature_matrix(X)
+    labels = np.asarray(y)
+    key = pool_key(features, labels, feature_names, border_count, feature_border_type)
+
+    if key in _memory_cache:
+        _memory_cache.move_to_end(key)
+        return _memory_cache[key]
+
+    path = os.path.join(cache_dir, f"{key}.bin") if cache_dir else None
+
+    if path and os.path.exists(path):
+        try:
+            pool = Pool("quantized://" + path)
+            os.utime(path)
+            _remember(key, pool)
+            return pool
+        except Exception as e:
+            print(f"⚠️  Cached pool unreadable, rebuilding: {e}")
+
+    pool = Pool(features, labels, feature_names=feature_names)
+    pool.quantize(border_count=border_count, feature_border_type=feature_border_type)
+
+    if path:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            pool.save(path)
+            prune_cache_dir(cache_dir, POOL_CACHE_SIZE, suffix=".bin")
+        except Exception as e:
+            print(f"⚠️  Could not persist quantized pool: {e}")
+
+    _remember(key, pool)
+    return pool
+
+
+def _remember(key, pool):
+    _memory_cache[key] = pool
+    while len(_memory_cache) > POOL_CACHE_SIZE:
+        _memory_cache.popitem(last=False)
+
+
+def prune_cache_dir(cache_dir, keep, prefix="", suffix=""):
+    """
+    Conserva en disco solo los `keep` archivos `prefix*suffix` de `cache_dir`
+    usados más recientemente (por fecha de modificación).
+    """
+    paths = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir)
+             if name.startswith(prefix) and name.endswith(suffix)]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[keep:]:
+        os.remove(path)
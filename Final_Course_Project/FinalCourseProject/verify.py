@@ -88,7 +88,8 @@ def check_dependencies():
         'catboost',
         'pandas',
         'numpy',
-        'sklearn'
+        'sklearn',
+        'pyarrow'
     ]
     
     missing = []
@@ -107,13 +108,47 @@ def check_dependencies():
     
     return True
 
+def check_pool_cache():
+    """Verifica que un Pool leído de la caché en disco predice igual que uno recién cuantizado"""
+    print("\n" + "="*50)
+    print("🧊 Verificando caché de Pools cuantizados...")
+    print("="*50 + "\n")
+
+    import tempfile
+    import numpy as np
+    import pandas as pd
+    import training_data
+    from train_model import ModelTrainer
+
+    rng = np.random.default_rng(42)
+    X = pd.DataFrame(rng.random((200, 4)), columns=[f"f{i}" for i in range(4)])
+    y = pd.Series(rng.integers(0, 4, len(X)))
+
+    trainer = ModelTrainer()
+    dtypes = {}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name in ("fría", "caliente"):
+            training_data._memory_cache.clear()
+            pool = training_data.get_quantized_pool(X, y, cache_dir=cache_dir)
+            model = trainer._fit_classifier(pool, y)
+            dtypes[name] = np.asarray(model.predict(X)).dtype
+            print(f"   Caché {name}: classes_={model.classes_.tolist()} predict dtype={dtypes[name]}")
+    training_data._memory_cache.clear()
+
+    if dtypes["fría"] != dtypes["caliente"]:
+        print("❌ La caché en disco cambia el tipo de las predicciones")
+        return False
+    print("✅ Mismo tipo de predicción con caché fría y caliente")
+    return True
+
 def main():
     print("\n🚀 VERIFICACIÓN DE PROYECTO - KAGGLE PREDICTOR\n")
     
     checks = [
         ("Estructura", check_structure),
         ("Dependencias", check_dependencies),
-        ("Datos de entrenamiento", check_train_data)
+        ("Datos de entrenamiento", check_train_data),
+        ("Caché de Pools", check_pool_cache)
     ]
     
     results = []
@@ -1,8 +1,23 @@
+import importlib.util
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
 from catboost import CatBoostClassifier
 
+# Módulo compartido de variables y objetivo. Se carga por ruta relativa a
+# este archivo, sin añadir Final_Course_Project/FinalCourseProject al
+# sys.path (así no quedan visibles su config.py ni su preprocess.py)
+FEATURES_PATH = os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "..",
+    "Final_Course_Project", "FinalCourseProject", "features.py"))
+_spec = importlib.util.spec_from_file_location("features", FEATURES_PATH)
+features = importlib.util.module_from_spec(_spec)
+sys.modules.setdefault("features", features)
+_spec.loader.exec_module(features)
+
 # =====================================================
 # 1. Cargar datos
 # =====================================================
@@ -16,16 +31,10 @@ print("test:", test.shape)
 # =====================================================
 # 2. Crear target multiclase
 # =====================================================
-def clasificar_pciat(valor):
-    if valor <= 20: 
-        return 0
-    elif valor <= 49:
-        return 1
-    elif valor <= 79:
-        return 2
-    return 3
-
-train["sii"] = train["PCIAT-PCIAT_Total"].apply(clasificar_pciat)
+# Cortes del PCIAT compartidos con el resto del proyecto (0-30, 31-49,
+# 50-79, 80+); las filas sin PCIAT se descartan en lugar de caer en la clase 3
+train = train.drop(columns=["sii"], errors="ignore")
+train = features.labeled(train)
 
 y = train["sii"]
 X = train.drop(columns=["sii"])
@@ -45,6 +54,17 @@ test = test[X.columns]
 
 print("\nColumnas alineadas entre train y test.")
 
+# =====================================================
+# 3b. Variables del modelo (mismo pipeline que la aplicación)
+# =====================================================
+# Ratios derivados, nivel de internet y estaciones como códigos ordenados
+# (Spring..Winter = 0..3, -1 = faltante); se ajusta con train y se aplica a test
+pipeline = features.model_pipeline()
+X = pipeline.fit_transform(X)
+test = pipeline.transform(test)
+
+print("Variables del pipeline:", pipeline.output_columns)
+
 # =====================================================
 # 4. Detectar categóricas
 # =====================================================
@@ -54,11 +74,11 @@ print("\nCategóricas detectadas:", cat_cols)
 
 # =====================================================
 # *** SOLUCIÓN: CatBoost NO acepta NaN en categóricas ***
-# Convertimos NaN a string "missing"
+# Convertimos NaN a string "missing" (las estaciones ya son códigos)
 # =====================================================
 for col in cat_cols:
-    X[col] = X[col].astype(str).fillna("missing")
-    test[col] = test[col].astype(str).fillna("missing")
+    X[col] = X[col].fillna("missing")
+    test[col] = test[col].fillna("missing")
 
 # =====================================================
 # 5. Modelo CatBoost (corregido para tu versión)
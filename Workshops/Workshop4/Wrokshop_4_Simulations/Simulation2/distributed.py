@@ -0,0 +1,279 @@
+import os
+import time
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from doc import (load_population, INTERNET_RISK, INTERNET_RISK_DEFAULT,
+                 high_neighbour_count, deterministic_risk)
+
+# -------------------------------
+# Motor distribuido del Escenario 2
+# -------------------------------
+#
+# La rejilla periódica N x N se divide en teselas de tamaño fijo repartidas
+# entre procesos. Cada paso es síncrono: todos leen el buffer t (con un halo
+# de una celda) y escriben el buffer t+1. El resultado no depende del número
+# de procesos porque cada tesela tiene su propio generador aleatorio,
+# derivado de la semilla de la simulación y del índice de la tesela.
+
+# Códigos de nivel de internet guardados en la rejilla (int8); el último
+# código corresponde a niveles desconocidos
+RISK_LUT = np.array([INTERNET_RISK[level] for level in INTERNET_RISK] + [INTERNET_RISK_DEFAULT])
+
+
+def internet_codes(levels):
+    """Convierte niveles de internet ('high', 'low', 'missing', ...) a códigos."""
+    levels = np.asarray(levels)
+    codes = np.full(levels.shape, len(INTERNET_RISK), dtype=np.int8)
+    for code, level in enumerate(INTERNET_RISK):
+        codes[levels == level] = code
+    return codes
+
+
+class SharedMemoryTransport:
+    """
+    Transporte local: la rejilla vive en memoria compartida con doble buffer,
+    así que el intercambio de halos es una lectura directa de las filas y
+    columnas vecinas tras la barrera de cada paso.
+
+    Tanto el proceso principal como los trabajadores usan solo esta interfaz
+    (handles/attach, window, tile, write_tile, internet_tile,
+    write_internet_tile, close), así que un transporte multi-nodo (p. ej. MPI)
+    puede sustituirla enviando los halos por la red en lugar de leerlos de
+    memoria compartida.
+    """
+
+    def __init__(self, N, handles=None):
+        self.N = N
+        self.owner = handles is None
+        self._shm = {}
+        for key in ("grid0", "grid1", "internet"):
+            if self.owner:
+                shm = shared_memory.SharedMemory(create=True, size=N * N)
+            else:
+                shm = shared_memory.SharedMemory(name=handles[key])
+            self._shm[key] = shm
+        self.grids = [np.ndarray((N, N), dtype=np.int8, buffer=self._shm[k].buf) for k in ("grid0", "grid1")]
+        self.internet = np.ndarray((N, N), dtype=np.int8, buffer=self._shm["internet"].buf)
+
+    def handles(self):
+        return {key: shm.name for key, shm in self._shm.items()}
+
+    @classmethod
+    def attach(cls, N, handles):
+        return cls(N, handles)
+
+    def window(self, parity, r0, r1, c0, c1):
+        """Tesela [r0:r1, c0:c1] del buffer `parity` con un halo periódico de 1 celda."""
+        rows = np.arange(r0 - 1, r1 + 1) % self.N
+        cols = np.arange(c0 - 1, c1 + 1) % self.N
+        return self.grids[parity][np.ix_(rows, cols)]
+
+    def tile(self, parity, r0, r1, c0, c1):
+        """Tesela [r0:r1, c0:c1] del buffer `parity`, sin halo."""
+        return self.grids[parity][r0:r1, c0:c1]
+
+    def write_tile(self, parity, r0, r1, c0, c1, values):
+        self.grids[parity][r0:r1, c0:c1] = values
+
+    def internet_tile(self, r0, r1, c0, c1):
+        return self.internet[r0:r1, c0:c1]
+
+    def write_internet_tile(self, r0, r1, c0, c1, codes):
+        self.internet[r0:r1, c0:c1] = codes
+
+    def close(self):
+        self.grids = self.internet = None
+        for shm in self._shm.values():
+            shm.close()
+            if self.owner:
+                shm.unlink()
+
+
+def tile_bounds(N, tile_size):
+    """Lista de teselas (r0, r1, c0, c1) en orden fijo; su índice identifica el RNG."""
+    starts = range(0, N, tile_size)
+    return [(r0, min(r0 + tile_size, N), c0, min(c0 + tile_size, N)) for r0 in starts for c0 in starts]
+
+
+def tile_rngs(seed, tile_id):
+    """Generadores de la tesela: uno para la población inicial y otro para la dinámica."""
+    init_seq, step_seq = np.random.SeedSequence(seed, spawn_key=(tile_id,)).spawn(2)
+    return np.random.default_rng(init_seq), np.random.default_rng(step_seq)
+
+
+def _worker(conn, transport_cls, N, handles, tiles, params):
+    """
+    Proceso trabajador: posee un subconjunto fijo de teselas y atiende
+    órdenes ('init', 'step', 'stop') del proceso principal.
+    """
+    transport = transport_cls.attach(N, handles)
+    rngs = {}
+    try:
+        while True:
+            command, arg = conn.recv()
+
+            if command == "init":
+                population_sii, population_codes = arg
+                counts = np.zeros(4, dtype=np.int64)
+                for tile_id, (r0, r1, c0, c1) in tiles:
+                    init_rng, step_rng = tile_rngs(params["seed"], tile_id)
+                    rngs[tile_id] = step_rng
+                    if population_sii is None:
+                        continue  # la rejilla ya fue escrita por el proceso principal
+                    idx = init_rng.integers(0, len(population_sii), size=(r1 - r0, c1 - c0))
+                    transport.write_tile(0, r0, r1, c0, c1, population_sii[idx])
+                    transport.write_internet_tile(r0, r1, c0, c1, population_codes[idx])
+                for _, (r0, r1, c0, c1) in tiles:
+                    counts += np.bincount(transport.tile(0, r0, r1, c0, c1).reshape(-1), minlength=4)
+                conn.send(counts)
+
+            elif command == "step":
+                parity = arg % 2
+                counts = np.zeros(4, dtype=np.int64)
+                for tile_id, (r0, r1, c0, c1) in tiles:
+                    new_tile = _step_tile(transport, parity, r0, r1, c0, c1, rngs[tile_id], params)
+                    transport.write_tile(1 - parity, r0, r1, c0, c1, new_tile)
+                    counts += np.bincount(new_tile.reshape(-1), minlength=4)
+                conn.send(counts)
+
+            elif command == "stop":
+                break
+    finally:
+        transport.close()
+        conn.close()
+
+
+def _step_tile(transport, parity, r0, r1, c0, c1, rng, params):
+    """Reglas de step() aplicadas a una tesela completa de forma vectorizada."""
+    window = transport.window(parity, r0, r1, c0, c1)
+    sii = window[1:-1, 1:-1].astype(np.int64)
+    inet_risk = RISK_LUT[transport.internet_tile(r0, r1, c0, c1)]
+
+    risk = deterministic_risk(sii, inet_risk, high_neighbour_count(window >= 2),
+                              params["w_self"], params["w_neigh"])
+    total_risk = np.clip(risk + rng.normal(0, params["noise_sd"], sii.shape), 0, 1)
+    u = rng.random(sii.shape)
+
+    up = (total_risk > params["up_th"]) & (u < 0.5) & (sii < 3)
+    down = ~up & (total_risk < params["down_th"]) & (u < 0.5) & (sii > 0)
+    return (sii + up - down).astype(np.int8)
+
+
+class DistributedCA:
+    """
+    Autómata del Escenario 2 repartido entre procesos locales.
+
+    Uso:
+        with DistributedCA(N=4096, workers=8, seed=123) as ca:
+            ca.populate(population_sii, population_internet)
+            history_df = ca.run(steps=50)
+    """
+
+    def __init__(self, N, workers=None, tile_size=256, seed=123,
+                 w_self=0.4, w_neigh=0.6, up_th=0.7, down_th=0.3, noise_sd=0.05,
+                 transport_cls=SharedMemoryTransport):
+        self.N = N
+        self.tiles = list(enumerate(tile_bounds(N, tile_size)))
+        self.workers = max(1, min(workers or os.cpu_count() or 1, len(self.tiles)))
+        self.params = {"seed": seed, "w_self": w_self, "w_neigh": w_neigh,
+                       "up_th": up_th, "down_th": down_th, "noise_sd": noise_sd}
+        self.transport = transport_cls(N)
+        handles = self.transport.handles()
+        self.parity = 0
+        self.counts = None
+
+        # Reparto round-robin: cada trabajador recibe teselas de toda la rejilla
+        ctx = mp.get_context("fork" if "fork" in mp.get_all_start_methods() else "spawn")
+        self.connections, self.processes = [], []
+        for w in range(self.workers):
+            parent, child = ctx.Pipe()
+            process = ctx.Process(target=_worker, daemon=True,
+                                  args=(child, transport_cls, N, handles, self.tiles[w::self.workers], self.params))
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+
+    def _broadcast(self, command, arg=None):
+        for conn in self.connections:
+            conn.send((command, arg))
+        # Reducción: suma de conteos por clase de todas las teselas
+        return sum(conn.recv() for conn in self.connections)
+
+    def populate(self, population_sii, population_internet):
+        """Llena la rejilla muestreando participantes reales (en paralelo, por tesela)."""
+        population_sii = np.asarray(population_sii, dtype=np.int8)
+        self.counts = self._broadcast("init", (population_sii, internet_codes(population_internet)))
+        self.parity = 0
+
+    def load_grids(self, grid_sii, grid_internet):
+        """Usa una rejilla inicial ya construida (p. ej. la de doc.py)."""
+        self.transport.write_tile(0, 0, self.N, 0, self.N, grid_sii)
+        self.transport.write_internet_tile(0, self.N, 0, self.N, internet_codes(grid_internet))
+        self.counts = self._broadcast("init", (None, None))
+        self.parity = 0
+
+    def run(self, steps=50):
+        """Ejecuta `steps` pasos síncronos; devuelve el historial de conteos por clase."""
+        history = []
+        for t in range(steps):
+            row = {"step": t}
+            for s in [0, 1, 2, 3]:
+                row[f"sii_{s}"] = int(self.counts[s])
+            history.append(row)
+
+            self.counts = self._broadcast("step", self.parity)
+            self.parity = 1 - self.parity
+        return pd.DataFrame(history)
+
+    def grid(self):
+        """Copia de la rejilla actual (solo para rejillas que caben en memoria)."""
+        return np.array(self.transport.tile(self.parity, 0, self.N, 0, self.N))
+
+    def close(self):
+        for conn in self.connections:
+            try:
+                conn.send(("stop", None))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Escenario 2 distribuido en procesos locales")
+    parser.add_argument("--size", type=int, default=2048, help="lado N de la rejilla N x N")
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=None, help="por defecto, todos los núcleos")
+    parser.add_argument("--tile-size", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=123)
+    args = parser.parse_args()
+
+    df = load_population()
+    print(f"\nRejilla {args.size}x{args.size} con teselas de {args.tile_size}...")
+    start = time.time()
+    with DistributedCA(args.size, workers=args.workers, tile_size=args.tile_size, seed=args.seed) as ca:
+        print(f"Procesos: {ca.workers}, teselas: {len(ca.tiles)}")
+        ca.populate(df["sii"].values, df["internet_level"].values)
+        history_df = ca.run(steps=args.steps)
+    elapsed = time.time() - start
+
+    print("\nPrimeras filas del historial de sii:")
+    print(history_df.head())
+    print(f"\nTiempo total: {elapsed:.1f} s")
+
+    history_df.to_csv("scenario2_distributed_history.csv", index=False)
+    print("Se guardó 'scenario2_distributed_history.csv'.")
@@ -1,80 +1,75 @@
+import heapq
+import importlib.util
+import math
+import os
+import sys
+
 import numpy as np
 import pandas as pd
 
+# Módulo compartido de variables y objetivo. Se carga por ruta relativa a
+# este archivo, sin añadir Final_Course_Project/FinalCourseProject al
+# sys.path (así no quedan visibles su config.py ni su preprocess.py)
+FEATURES_PATH = os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "..",
+    "Final_Course_Project", "FinalCourseProject", "features.py"))
+_spec = importlib.util.spec_from_file_location("features", FEATURES_PATH)
+features = importlib.util.module_from_spec(_spec)
+sys.modules.setdefault("features", features)
+_spec.loader.exec_module(features)
+
 # -------------------------------
 # 1. Cargar datos y preparar estado inicial
 # -------------------------------
+#
+# El script se ejecuta solo bajo __main__: distributed.py importa las reglas
+# de este módulo y sus procesos no deben volver a leer los datos.
 
-train = pd.read_csv("train.csv")
-
-# Usar 'sii' si existe. Si no, derivarlo de 'PCIAT-PCIAT_Total'
-if "sii" in train.columns:
-    df = train.dropna(subset=["sii"]).copy()
-    df["sii"] = df["sii"].astype(int)
-else:
-    def sii_from_pciat(x):
-        if pd.isna(x):
-            return np.nan
-        x = float(x)
-        if x <= 30:
-            return 0
-        elif x <= 49:
-            return 1
-        elif x <= 79:
-            return 2
-        else:
-            return 3
-
-    df = train.copy()
-    df["sii"] = df["PCIAT-PCIAT_Total"].apply(sii_from_pciat)
-    df = df.dropna(subset=["sii"]).copy()
-    df["sii"] = df["sii"].astype(int)
-
-print("Distribución real de sii en train (después de limpiar):")
-print(df["sii"].value_counts().sort_index())
-
-# Discretizar una variable de uso de internet (si existe)
-internet_col = "PreInt_EduHx-computerinternet_hoursday"
-if internet_col in df.columns:
-    q1, q3 = df[internet_col].quantile([0.25, 0.75])
-
-    def disc_internet(v):
-        if pd.isna(v):
-            return "missing"
-        v = float(v)
-        if v <= q1:
-            return "low"
-        elif v <= q3:
-            return "medium"
-        else:
-            return "high"
+def load_population(path="train.csv"):
+    """
+    Lee los participantes y devuelve un DataFrame con 'sii' (la columna
+    existente o, si falta, derivada de 'PCIAT-PCIAT_Total' con los mismos
+    cortes que el resto del proyecto) e 'internet_level'.
+    """
+    train = pd.read_csv(path)
+    df = features.labeled(train)
+
+    print("Distribución real de sii en train (después de limpiar):")
+    print(df["sii"].value_counts().sort_index())
 
-    df["internet_level"] = df[internet_col].apply(disc_internet)
-else:
-    df["internet_level"] = "unknown"
+    # Mismo pipeline de variables que el modelo: el nivel de internet
+    # (cuartiles 1 y 3) llega como código y se traduce a low/medium/high
+    df = features.model_pipeline().fit_transform(df)
+    if "FE-internet_level" in df.columns:
+        df["internet_level"] = features.decode(df["FE-internet_level"], features.INTERNET_LABELS)
+    else:
+        df["internet_level"] = "unknown"
 
-print("\nNiveles de internet en los datos:")
-print(df["internet_level"].value_counts())
+    print("\nNiveles de internet en los datos:")
+    print(df["internet_level"].value_counts())
+    return df
 
 # -------------------------------
 # 2. Inicializar rejilla del autómata
 # -------------------------------
 
-N = 30  # tamaño de la rejilla: N x N
-num_cells = N * N
-
-# muestrear participantes reales para poblar la rejilla
-sample = df[["sii", "internet_level"]].sample(
-    num_cells, replace=True, random_state=42
-).reset_index(drop=True)
+def initial_grid(df, N=30, random_state=42):
+    """
+    Puebla una rejilla N x N muestreando participantes reales.
+    Devuelve (grid_sii, grid_internet).
+    """
+    sample = df[["sii", "internet_level"]].sample(
+        N * N, replace=True, random_state=random_state
+    ).reset_index(drop=True)
 
-grid_sii = sample["sii"].values.reshape(N, N)                  # estados sii
-grid_internet = sample["internet_level"].values.reshape(N, N)  # nivel de internet
+    grid_sii = sample["sii"].values.reshape(N, N)                  # estados sii
+    grid_internet = sample["internet_level"].values.reshape(N, N)  # nivel de internet
 
-print(f"\nRejilla inicial creada con tamaño {N}x{N}.")
-unique, counts = np.unique(grid_sii, return_counts=True)
-print("Distribución de sii en la rejilla inicial:")
-print(dict(zip(unique, counts)))
+    print(f"\nRejilla inicial creada con tamaño {N}x{N}.")
+    unique, counts = np.unique(grid_sii, return_counts=True)
+    print("Distribución de sii en la rejilla inicial:")
+    print(dict(zip(unique, counts)))
+    return grid_sii, grid_internet
 
 # -------------------------------
 # 3. Reglas del autómata celular
@@ -92,21 +87,17 @@ def get_neighbours(i, j, N):
             neigh.append((ni, nj))
     return neigh
 
+INTERNET_RISK = {"high": 0.6, "medium": 0.3, "low": 0.1}
+INTERNET_RISK_DEFAULT = 0.2  # missing/unknown
+
 def internet_risk(level):
     """Riesgo según nivel de internet (parámetros ajustables)."""
-    if level == "high":
-        return 0.6
-    elif level == "medium":
-        return 0.3
-    elif level == "low":
-        return 0.1
-    else:
-        return 0.2  # missing/unknown
+    return INTERNET_RISK.get(level, INTERNET_RISK_DEFAULT)
 
 def step(grid_sii, grid_internet,
          w_self=0.4, w_neigh=0.6,
          up_th=0.7, down_th=0.3,
-         rng=None):
+         rng=None, noise_sd=0.05):
     """Un paso de actualización del autómata celular."""
     if rng is None:
         rng = np.random.default_rng()
@@ -131,7 +122,7 @@ def step(grid_sii, grid_internet,
 
             # riesgo total
             total_risk = w_self * risk_self_part + w_neigh * high_neigh
-            total_risk = np.clip(total_risk + rng.normal(0, 0.05), 0, 1)
+            total_risk = np.clip(total_risk + rng.normal(0, noise_sd), 0, 1)
 
             u = rng.random()
             new_state = sii_ij
@@ -147,6 +138,362 @@ def step(grid_sii, grid_internet,
     return new_grid
 
 
+# -------------------------------
+# 3b. Motor disperso (frontera activa)
+# -------------------------------
+
+def internet_risk_grid(grid_internet):
+    """Riesgo de internet para toda la rejilla (misma tabla que internet_risk)."""
+    risk = np.full(grid_internet.shape, INTERNET_RISK_DEFAULT)
+    for level, value in INTERNET_RISK.items():
+        risk[grid_internet == level] = value
+    return risk
+
+def high_neighbour_count(high):
+    """
+    Número de vecinos de Moore en True para cada celda de una ventana con
+    un borde de 1 celda (la salida mide 2 menos por lado).
+    """
+    h, w = high.shape[0] - 2, high.shape[1] - 2
+    count = np.zeros((h, w), dtype=np.int8)
+    for di in [-1, 0, 1]:
+        for dj in [-1, 0, 1]:
+            if di == 0 and dj == 0:
+                continue
+            count += high[1 + di:1 + di + h, 1 + dj:1 + dj + w]
+    return count
+
+def deterministic_risk(grid_sii, inet_risk, high_count, w_self=0.4, w_neigh=0.6):
+    """Riesgo total de step() antes de sumar el ruido."""
+    risk_self_part = 0.5 * (grid_sii / 3.0) + 0.5 * inet_risk
+    return w_self * risk_self_part + w_neigh * (high_count / 8.0)
+
+class SparseEngine:
+    """
+    Motor de frontera activa para el autómata de step().
+
+    Solo se evalúan las celdas "activas": aquellas cuyo riesgo determinista
+    está a menos de `band_sigmas` desviaciones del ruido de up_th (si aún
+    pueden subir) o de down_th (si aún pueden bajar). Fuera de esa banda la
+    probabilidad de cambiar en un paso es menor que 1e-4 con 4 sigmas.
+
+    El riesgo solo se recalcula en las teselas marcadas en el mapa de bits
+    de teselas sucias, es decir, donde alguna celda o su vecindario cambió
+    en el paso anterior. Cerca del equilibrio el coste por paso depende del
+    tamaño de la frontera y no del de la rejilla.
+    """
+
+    def __init__(self, grid_sii, grid_internet,
+                 w_self=0.4, w_neigh=0.6,
+                 up_th=0.7, down_th=0.3,
+                 noise_sd=0.05, tile_size=16, band_sigmas=4.0):
+        self.grid = np.array(grid_sii, dtype=np.int64)
+        self.N = self.grid.shape[0]
+        self.inet_risk = internet_risk_grid(grid_internet)
+        self.w_self, self.w_neigh = w_self, w_neigh
+        self.up_th, self.down_th = up_th, down_th
+        self.noise_sd = noise_sd
+        self.margin = band_sigmas * noise_sd
+        self.tile_size = tile_size
+        self.n_tiles = -(-self.N // tile_size)
+
+        high = np.pad(self.grid >= 2, 1, mode="wrap")
+        self.risk = deterministic_risk(self.grid, self.inet_risk, high_neighbour_count(high),
+                                       w_self, w_neigh)
+        self.active = self._in_band(self.risk, self.grid)
+        self.evaluated = 0  # celdas evaluadas en total (para medir el ahorro)
+
+    def _in_band(self, risk, sii):
+        return (((sii < 3) & (risk > self.up_th - self.margin))
+                | ((sii > 0) & (risk < self.down_th + self.margin)))
+
+    def step(self, rng):
+        """Avanza un paso (modifica la rejilla en sitio) y la devuelve."""
+        idx = np.flatnonzero(self.active)
+        self.evaluated += len(idx)
+        if len(idx) == 0:
+            return self.grid
+
+        flat = self.grid.reshape(-1)
+        sii = flat[idx]
+        total_risk = np.clip(self.risk.reshape(-1)[idx] + rng.normal(0, self.noise_sd, len(idx)), 0, 1)
+        u = rng.random(len(idx))
+
+        up = (total_risk > self.up_th) & (u < 0.5) & (sii < 3)
+        down = ~up & (total_risk < self.down_th) & (u < 0.5) & (sii > 0)
+        flat[idx[up]] += 1
+        flat[idx[down]] -= 1
+
+        changed = idx[up | down]
+        if len(changed):
+            self._refresh(changed)
+        return self.grid
+
+    def _refresh(self, changed):
+        """Recalcula riesgo y banda activa en las teselas sucias."""
+        N, T = self.N, self.tile_size
+        rows, cols = np.divmod(changed, N)
+
+        # Un cambio afecta a su vecindario, que puede caer en la tesela contigua
+        dirty = np.zeros((self.n_tiles, self.n_tiles), dtype=bool)
+        for di in [-1, 0, 1]:
+            for dj in [-1, 0, 1]:
+                dirty[((rows + di) % N) // T, ((cols + dj) % N) // T] = True
+
+        if dirty.mean() > 0.25:
+            # Con muchas teselas sucias sale más barato recalcular la rejilla entera
+            high = np.pad(self.grid >= 2, 1, mode="wrap")
+            self.risk = deterministic_risk(self.grid, self.inet_risk, high_neighbour_count(high),
+                                           self.w_self, self.w_neigh)
+            self.active = self._in_band(self.risk, self.grid)
+            return
+
+        for ti, tj in zip(*np.nonzero(dirty)):
+            r0, r1 = ti * T, min((ti + 1) * T, N)
+            c0, c1 = tj * T, min((tj + 1) * T, N)
+            window = np.ix_(np.arange(r0 - 1, r1 + 1) % N, np.arange(c0 - 1, c1 + 1) % N)
+            sii = self.grid[r0:r1, c0:c1]
+            risk = deterministic_risk(sii, self.inet_risk[r0:r1, c0:c1],
+                                      high_neighbour_count(self.grid[window] >= 2),
+                                      self.w_self, self.w_neigh)
+            self.risk[r0:r1, c0:c1] = risk
+            self.active[r0:r1, c0:c1] = self._in_band(risk, sii)
+
+
+# -------------------------------
+# 3c. Motor de eventos (actualización asíncrona)
+# -------------------------------
+
+def _normal_cdf(x):
+    return 0.5 * math.erfc(-x / math.sqrt(2.0))
+
+_normal_cdf_array = np.vectorize(_normal_cdf, otypes=[float])
+
+class EventEngine:
+    """
+    Versión asíncrona del autómata, simulada con el método de la siguiente
+    reacción (Gillespie con cola de prioridad).
+
+    Cada celda se actualiza según un reloj de Poisson de tasa `rate`: al
+    dispararse aplica las reglas de step() con el estado actual de sus
+    vecinos. Una unidad de tiempo equivale en promedio a un barrido
+    completo. Los disparos que no cambian el estado no se simulan. En su
+    lugar, cada celda lleva las tasas de subir y de bajar (la tasa del
+    reloj multiplicada por la probabilidad de que las reglas cambien el
+    estado) y un tiempo de siguiente evento en un heap.
+
+    Un cambio solo altera el riesgo de la propia celda y, si cruza el umbral
+    sii >= 2, el de sus 8 vecinos. Son las únicas celdas cuyas tasas y
+    tiempos se recalculan, así que el coste crece con el número de eventos
+    y no con el tamaño de la rejilla.
+    """
+
+    def __init__(self, grid_sii, grid_internet,
+                 w_self=0.4, w_neigh=0.6,
+                 up_th=0.7, down_th=0.3,
+                 noise_sd=0.05, rate=1.0):
+        self.grid = np.array(grid_sii, dtype=np.int64)
+        self.N = self.grid.shape[0]
+        self.inet_risk = internet_risk_grid(grid_internet)
+        self.w_self, self.w_neigh = w_self, w_neigh
+        self.up_th, self.down_th = up_th, down_th
+        self.noise_sd = noise_sd
+        self.rate = rate
+
+        high = np.pad(self.grid >= 2, 1, mode="wrap")
+        self.high_count = high_neighbour_count(high).astype(np.int64)
+        self.counts = np.bincount(self.grid.reshape(-1), minlength=4)
+
+        self.time = 0.0
+        self.events = 0  # cambios de estado procesados
+        self.version = np.zeros(self.N * self.N, dtype=np.int64)
+        self.up_rate = np.zeros(self.N * self.N)
+        self.down_rate = np.zeros(self.N * self.N)
+        self.heap = []
+
+    def _rates(self, sii, risk, cdf=_normal_cdf):
+        """Tasas (subir, bajar) para celdas con estado `sii` y riesgo determinista `risk`."""
+        # Mismas reglas que step(): el recorte a [0, 1] solo importa si un umbral cae fuera de (0, 1)
+        if self.noise_sd > 0:
+            p_up = 1.0 - cdf((self.up_th - risk) / self.noise_sd)
+            p_down = cdf((self.down_th - risk) / self.noise_sd)
+        else:
+            p_up, p_down = 1.0 * (risk > self.up_th), 1.0 * (risk < self.down_th)
+        p_up = p_up * ((sii < 3) & (self.up_th < 1))
+        p_down = p_down * ((sii > 0) & (self.down_th > 0))
+        return 0.5 * self.rate * p_up, 0.5 * self.rate * p_down
+
+    def _schedule(self, cell, rng):
+        """Recalcula las tasas de la celda y sortea su siguiente evento."""
+        i, j = divmod(cell, self.N)
+        risk = deterministic_risk(self.grid[i, j], self.inet_risk[i, j], self.high_count[i, j],
+                                  self.w_self, self.w_neigh)
+        up, down = self._rates(self.grid[i, j], risk)
+        self.up_rate[cell], self.down_rate[cell] = up, down
+        self.version[cell] += 1
+        total = up + down
+        if total > 0:
+            # Los relojes exponenciales no tienen memoria: se puede volver a sortear
+            heapq.heappush(self.heap, (self.time + rng.exponential(1.0 / total),
+                                       self.version[cell], cell))
+
+    def start(self, rng):
+        """Programa el primer evento de todas las celdas (vectorizado)."""
+        risk = deterministic_risk(self.grid, self.inet_risk, self.high_count,
+                                  self.w_self, self.w_neigh)
+        up, down = self._rates(self.grid, risk, cdf=_normal_cdf_array)
+        self.up_rate, self.down_rate = up.reshape(-1), down.reshape(-1)
+        self.version[:] = 1
+
+        total = self.up_rate + self.down_rate
+        cells = np.flatnonzero(total > 0)
+        times = self.time + rng.exponential(1.0 / total[cells])
+        self.heap = list(zip(times.tolist(), [1] * len(cells), cells.tolist()))
+        heapq.heapify(self.heap)
+
+    def advance(self, t_end, rng):
+        """Procesa todos los eventos con tiempo <= t_end."""
+        N = self.N
+        while self.heap and self.heap[0][0] <= t_end:
+            t, version, cell = heapq.heappop(self.heap)
+            if version != self.version[cell]:
+                continue  # entrada obsoleta: la celda fue reprogramada
+            self.time = t
+
+            i, j = divmod(cell, N)
+            up, down = self.up_rate[cell], self.down_rate[cell]
+            old = self.grid[i, j]
+            new = old + 1 if rng.random() * (up + down) < up else old - 1
+            self.grid[i, j] = new
+            self.counts[old] -= 1
+            self.counts[new] += 1
+            self.events += 1
+
+            affected = [cell]
+            if (old >= 2) != (new >= 2):
+                delta = 1 if new >= 2 else -1
+                for ni, nj in get_neighbours(i, j, N):
+                    self.high_count[ni, nj] += delta
+                    affected.append(ni * N + nj)
+            for c in affected:
+                self._schedule(c, rng)
+
+        self.time = t_end
+        return self.grid
+
+
+# -------------------------------
+# 3d. Analítica espacial (clústeres de alto riesgo)
+# -------------------------------
+
+# Mitad del vecindario de Moore: cada par de vecinos se visita una sola vez
+_HALF_MOORE = [(0, 1), (1, -1), (1, 0), (1, 1)]
+
+def label_clusters(mask):
+    """
+    Componentes conexas (vecindario de Moore, bordes periódicos) de las
+    celdas en True. Union-find vectorizado: cada raíz adopta la menor raíz
+    de sus vecinas y se comprimen caminos hasta que nada cambia. Las aristas
+    que cruzan el borde entran igual que las demás, así que un clúster que
+    da la vuelta a la rejilla queda unido.
+    Devuelve (labels, sizes): labels vale -1 fuera de la máscara y 0..k-1
+    dentro; sizes[c] es el tamaño del clúster c.
+    """
+    N, M = mask.shape
+    cells = np.flatnonzero(mask)
+    if len(cells) == 0:
+        return np.full(mask.shape, -1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    index = np.arange(N * M).reshape(N, M)
+    a, b = [], []
+    for di, dj in _HALF_MOORE:
+        both = mask & np.roll(mask, (-di, -dj), axis=(0, 1))
+        a.append(index[both])
+        b.append(np.roll(index, (-di, -dj), axis=(0, 1))[both])
+    a, b = np.concatenate(a), np.concatenate(b)
+
+    parent = np.arange(N * M)
+    while True:
+        ra, rb = parent[a], parent[b]
+        low = np.minimum(ra, rb)
+        np.minimum.at(parent, ra, low)
+        np.minimum.at(parent, rb, low)
+        # Compresión de caminos
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent = grand
+        if np.array_equal(parent[a], parent[b]):
+            break
+
+    roots, compact = np.unique(parent[cells], return_inverse=True)
+    labels = np.full(N * M, -1, dtype=np.int64)
+    labels[cells] = compact
+    return labels.reshape(N, M), np.bincount(compact, minlength=len(roots))
+
+def interface_length(mask):
+    """Número de lados (vecindario de von Neumann, periódico) entre celdas en True y en False."""
+    return int((mask != np.roll(mask, 1, axis=0)).sum() + (mask != np.roll(mask, 1, axis=1)).sum())
+
+class ClusterTracker:
+    """
+    Analítica incremental durante run_simulation: cada `every` pasos etiqueta
+    los clústeres de celdas con sii >= `threshold` y acumula sus métricas.
+    Solo conserva la rejilla de la comprobación anterior, no todos los
+    fotogramas.
+
+    Estado absorbente: si la rejilla no cambia en `patience` comprobaciones
+    seguidas, absorbed pasa a True (run_simulation puede parar ahí).
+    """
+
+    def __init__(self, every=5, threshold=2, patience=2):
+        self.every = every
+        self.threshold = threshold
+        self.patience = patience
+        self.records = []
+        self.size_histogram = np.zeros(1, dtype=np.int64)  # [tamaño] -> nº de clústeres, sumado en el tiempo
+        self.previous = None
+        self.unchanged = 0
+        self.absorbed = False
+
+    def update(self, t, grid):
+        """Registra las métricas del paso t. Devuelve True si se detecta estado absorbente."""
+        mask = grid >= self.threshold
+        _, sizes = label_clusters(mask)
+
+        histogram = np.bincount(sizes)
+        if len(histogram) > len(self.size_histogram):
+            self.size_histogram = np.pad(self.size_histogram, (0, len(histogram) - len(self.size_histogram)))
+        self.size_histogram[:len(histogram)] += histogram
+
+        if self.previous is not None and np.array_equal(grid, self.previous):
+            self.unchanged += 1
+        else:
+            self.unchanged = 0
+        self.previous = grid.copy()
+        self.absorbed = self.unchanged >= self.patience
+
+        self.records.append({
+            "step": t,
+            "high_cells": int(mask.sum()),
+            "n_clusters": len(sizes),
+            "largest_cluster": int(sizes.max()) if len(sizes) else 0,
+            "mean_cluster_size": float(sizes.mean()) if len(sizes) else 0.0,
+            "interface_length": interface_length(mask),
+            "absorbed": self.absorbed,
+        })
+        return self.absorbed
+
+    def to_frame(self):
+        return pd.DataFrame(self.records)
+
+    def size_distribution(self):
+        """Distribución acumulada de tamaños de clúster (tamaño, nº de clústeres)."""
+        sizes = np.flatnonzero(self.size_histogram)
+        return pd.DataFrame({"size": sizes, "count": self.size_histogram[sizes]})
+
+
 # -------------------------------
 # 4. Bucle de simulación y salida
 # -------------------------------
@@ -157,9 +504,21 @@ def run_simulation(grid_sii, grid_internet,
                    w_self=0.4,
                    w_neigh=0.6,
                    up_th=0.7,
-                   down_th=0.3):
+                   down_th=0.3,
+                   engine="dense",
+                   noise_sd=0.05,
+                   tile_size=16,
+                   band_sigmas=4.0,
+                   analytics=None,
+                   stop_on_absorbing=False):
     """
     Ejecuta la simulación durante 'steps' pasos.
+    engine="dense" usa step() celda a celda; engine="sparse" usa SparseEngine;
+    engine="event" usa EventEngine (asíncrono) y muestrea el historial en
+    t = 0, 1, ..., steps - 1, donde una unidad de tiempo equivale a un barrido.
+    analytics: ClusterTracker opcional que se actualiza cada analytics.every
+    pasos; con stop_on_absorbing=True la simulación termina al detectar un
+    estado absorbente.
     Devuelve:
       - history_df: distribución de sii por paso.
       - final_grid: rejilla final de sii.
@@ -168,33 +527,124 @@ def run_simulation(grid_sii, grid_internet,
     current = grid_sii.copy()
     history = []
 
+    if engine == "sparse":
+        sparse = SparseEngine(current, grid_internet,
+                              w_self=w_self, w_neigh=w_neigh,
+                              up_th=up_th, down_th=down_th,
+                              noise_sd=noise_sd, tile_size=tile_size,
+                              band_sigmas=band_sigmas)
+        current = sparse.grid
+    elif engine == "event":
+        events = EventEngine(current, grid_internet,
+                             w_self=w_self, w_neigh=w_neigh,
+                             up_th=up_th, down_th=down_th,
+                             noise_sd=noise_sd)
+        events.start(rng)
+        current = events.grid
+    elif engine != "dense":
+        raise ValueError(f"Motor desconocido: {engine}")
+
     for t in range(steps):
-        unique, counts = np.unique(current, return_counts=True)
-        counts_dict = {int(k): int(v) for k, v in zip(unique, counts)}
+        if engine == "event":
+            # Cuentas mantenidas por el motor en cada evento: O(1) por paso
+            counts = events.counts
+        else:
+            counts = np.bincount(current.reshape(-1), minlength=4)
 
         row = {"step": t}
         for s in [0, 1, 2, 3]:
-            row[f"sii_{s}"] = counts_dict.get(s, 0)
+            row[f"sii_{s}"] = int(counts[s])
         history.append(row)
 
-        current = step(current, grid_internet,
-                       w_self=w_self,
-                       w_neigh=w_neigh,
-                       up_th=up_th,
-                       down_th=down_th,
-                       rng=rng)
+        if analytics is not None and t % analytics.every == 0:
+            if analytics.update(t, current) and stop_on_absorbing:
+                break
+
+        if engine == "sparse":
+            current = sparse.step(rng)
+        elif engine == "event":
+            current = events.advance(t + 1, rng)
+        else:
+            current = step(current, grid_internet,
+                           w_self=w_self,
+                           w_neigh=w_neigh,
+                           up_th=up_th,
+                           down_th=down_th,
+                           rng=rng,
+                           noise_sd=noise_sd)
 
     history_df = pd.DataFrame(history)
-    return history_df, current
+    return history_df, current.copy()
+
+
+def compare_engines(grid_sii, grid_internet, steps=50, replicates=20, seed=0,
+                    tolerance=4.0, **params):
+    """
+    Modo de verificación: ejecuta el motor denso y el disperso con
+    `replicates` semillas cada uno y compara, paso a paso, la media de cada
+    clase sii (diferencia en errores estándar).
+    Devuelve (comparison_df, ok); ok es True si ninguna |z| supera `tolerance`.
+    """
+    seeds = np.random.SeedSequence(seed).generate_state(replicates)
+    classes = [f"sii_{s}" for s in [0, 1, 2, 3]]
+    runs = {"dense": [], "sparse": []}
+    for engine in runs:
+        for s in seeds:
+            history_df, _ = run_simulation(grid_sii, grid_internet, steps=steps,
+                                           seed=int(s), engine=engine, **params)
+            runs[engine].append(history_df[classes].to_numpy(dtype=float))
+
+    dense, sparse = np.stack(runs["dense"]), np.stack(runs["sparse"])
+    diff = sparse.mean(axis=0) - dense.mean(axis=0)
+    se = np.sqrt(dense.var(axis=0, ddof=1) / replicates + sparse.var(axis=0, ddof=1) / replicates)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(se > 0, diff / se, np.where(diff == 0, 0.0, np.inf))
+
+    comparison = {"step": np.arange(steps)}
+    for k, name in enumerate(classes):
+        comparison[f"dense_{name}"] = dense.mean(axis=0)[:, k]
+        comparison[f"sparse_{name}"] = sparse.mean(axis=0)[:, k]
+        comparison[f"z_{name}"] = z[:, k]
+    comparison_df = pd.DataFrame(comparison)
+    return comparison_df, bool(np.all(np.abs(z) <= tolerance))
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Escenario 2: autómata celular")
+    parser.add_argument("--engine", choices=["dense", "sparse", "event"], default="dense")
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--analytics", type=int, default=0, metavar="K",
+                        help="analizar clústeres de sii >= 2 cada K pasos")
+    parser.add_argument("--stop-absorbing", action="store_true",
+                        help="parar al detectar un estado absorbente (requiere --analytics)")
+    parser.add_argument("--check", action="store_true",
+                        help="comparar estadísticamente el motor disperso con el denso")
+    args = parser.parse_args()
+
+    df = load_population()
+    grid_sii, grid_internet = initial_grid(df)
+
+    if args.check:
+        print("\nComparando motor disperso con motor denso...")
+        comparison_df, ok = compare_engines(grid_sii, grid_internet, steps=args.steps)
+        z_cols = [c for c in comparison_df.columns if c.startswith("z_")]
+        print(comparison_df[z_cols].abs().max())
+        print("Resultados estadísticamente equivalentes." if ok
+              else "ATENCIÓN: el motor disperso difiere del denso.")
+
+    tracker = ClusterTracker(every=args.analytics) if args.analytics > 0 else None
+
     print("\nEjecutando simulación del Escenario 2...")
     history_df, final_grid = run_simulation(
         grid_sii,
         grid_internet,
-        steps=50,
-        seed=123
+        steps=args.steps,
+        seed=123,
+        engine=args.engine,
+        analytics=tracker,
+        stop_on_absorbing=args.stop_absorbing
     )
 
     print("\nPrimeras filas del historial de sii:")
@@ -208,4 +658,13 @@ if __name__ == "__main__":
     print("\nDistribución de sii en la rejilla final:")
     print(dict(zip(unique_f, counts_f)))
 
+    if tracker is not None:
+        clusters_df = tracker.to_frame()
+        print("\nClústeres de alto riesgo (sii >= 2):")
+        print(clusters_df.tail())
+        if tracker.absorbed:
+            print(f"Estado absorbente detectado en el paso {int(clusters_df['step'].iloc[-1])}.")
+        clusters_df.to_csv("scenario2_clusters.csv", index=False)
+        print("Se guardó 'scenario2_clusters.csv'.")
+
     print("\nEscenario 2 completado.")
\ No newline at end of file